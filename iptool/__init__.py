@@ -5,13 +5,70 @@
   address alias if it's the same as the interface name.
   
 Usage:
-  iptool [ -sigc ] [ <interface> ]
+  iptool [ list ] [ -sigcp ] [ -S <fields> ] [ --stream | --all-netns ] [ --json | --ndjson ] [ <interface> ]
+  iptool monitor [ -sigc ] [ --json | --ndjson ]
+  iptool neigh [ --state=<states> ] [ --json | --ndjson ] [ <interface> ]
+  iptool route-get [ --json | --ndjson ] [ <file> ... ]
+  iptool find [ --json | --ndjson ] [ <address> | <prefix> ... ]
+  iptool addrs [ -v ] [ --json | --ndjson ]
+  iptool tree [ -sig ] [ -S <fields> ] [ --json | --ndjson ] [ <interface> ]
+  iptool top [ -n <count> ] [ --interval=<seconds> ] [ --json | --ndjson ]
+  iptool serve [ --socket=<path> ]
+  iptool --client [ --socket=<path> ] [ list ] [ -sigc ] [ -S <fields> ] [ <interface> ]
+Commands:
+  list               Shows interfaces (the default)
+  monitor            Shows interfaces whenever they or their addresses change;
+                     with --json, each batch of changes is a JSON array on a
+                     line of its own
+  neigh              Shows the neighbour (ARP/NDP) table
+  route-get          Shows the interface and next hop used to reach each
+                     address read from the files (or stdin), one per line
+  find               Shows the interfaces that have each address, or have
+                     addresses inside each prefix (e.g. 10.0.0.0/8); these
+                     are read from stdin if none are given
+  addrs              Shows every address, sorted by address
+  tree               Shows the ports of each bridge or bond and the VLANs
+                     (etc.) on top of each interface, as a tree, optionally
+                     only under the given interface
+  top                Shows the interfaces with the most traffic, repeatedly;
+                     with --json, each update is a JSON array on a line of
+                     its own
+  serve              Keeps interface info up to date in memory and answers
+                     queries from "iptool --client" over a Unix socket
 Options:
   -s  --state-sort   Sorts by interface state, then name
   -i  --id-sort      Sorts by interface ID
+  -S  --sort=FIELDS  Sorts by a comma-separated list of fields, then name;
+                     the fields are name, id, state, mtu and type
   -g  --no-grouping  Don't sort by interface type (loopback, other, tunnel)
   -vv                Show link-local addresses
   -c  --compact      Don't show a blank line between interfaces
+  -p  --parallel     Dump links and IPv4/IPv6 addresses at the same time
+                     using a socket for each
+      --stream       Show each interface as soon as all of its info has
+                     arrived, without sorting (implies -p); --json output
+                     is still written in one go at the end
+      --all-netns    Show interfaces in every network namespace (from
+                     /run/netns and running processes), labelling each one
+  -n  --count=N      Number of interfaces shown by top (default: 10)
+      --interval=SECS
+                     Time between updates from top (default: 1)
+      --state=STATES Only show neighbours in one of a comma-separated list of
+                     states, e.g. reachable,stale
+      --json         Output a JSON array of interfaces (including link-local
+                     addresses) instead of text
+      --ndjson       Output one JSON object per interface per line
+      --capture=FILE Save the raw replies from the kernel to FILE
+      --replay=FILE  Use replies saved by --capture (with the same command
+                     and options) instead of asking the kernel; neither
+                     works with -p, --stream, --all-netns, monitor or serve
+      --timings      Show how long each phase took (in ms) on stderr, as JSON
+                     with --json or --ndjson
+      --stats        Show how much was received and decoded, including
+                     rtattr types that weren't understood, likewise
+  -d                 Same as --timings --stats
+      --client       Ask a running "iptool serve" instead of the kernel
+      --socket=PATH  Unix socket used by serve and --client
 '''
 
 
@@ -22,172 +79,307 @@ import sys
 import getopt
 import socket
 import os
-import ctypes
-import binascii
-import types
+import errno
 
-import cpylmnl.linux.netlinkh as netlink
-import cpylmnl.linux.rtnetlinkh as rtnl
-import cpylmnl.linux.if_addrh as if_addr
-
-from . import iplist
+# Modules only needed by some commands are imported when they're used, to
+# keep startup quick
 from . import families
+from . import decode
+from . import constants
+from . import timing
+from . import util
 from .globals import params
 
 
 self="iptool"
-allowed_options='hdsigcv'
-allowed_long_options=['help', 'state-sort', 'id-sort', 'no-grouping', 'compact', 'verbose']
+allowed_options='hdsiS:gcvpn:'
+allowed_long_options=['help', 'state-sort', 'id-sort', 'sort=', 'no-grouping', 'compact',
+                      'verbose', 'parallel', 'stream', 'all-netns', 'count=', 'interval=',
+                      'state=', 'json', 'ndjson', 'capture=', 'replay=', 'timings', 'stats', 'client',
+                      'socket=']
+
+commands = ('list', 'monitor', 'neigh', 'route-get', 'find', 'addrs', 'tree', 'top', 'serve')
 
 
 
 # *** CLASSES ***
 
-class NetlinkSocket(object):
-    def __init__(self, proto):
-        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, proto)
-        self.sock.bind((0,0))
-
-        self.hdr = netlink.Nlmsghdr()
-        self.hdr.nlmsg_len = -1
-        self.hdr.nlmsg_type = -1
-        self.hdr.nlmsg_seq = 0
-        self.hdr.nlmsg_pid = os.getpid()
-
-
-    def send_msg(self, msg_type, payload):
-        payload_len = payload.csize()
-
-        self.hdr.nlmsg_seq += 1
-        self.hdr.nlmsg_len = netlink.NLMSG_ALIGN(netlink.NLMSG_LENGTH(payload_len))
-        self.hdr.nlmsg_type = msg_type
-        # 
-        if type(payload) is rtnl.Rtgenmsg:
-            self.hdr.nlmsg_flags = netlink.NLM_F_REQUEST | netlink.NLM_F_DUMP
-        else:
-            self.hdr.nlmsg_flags = netlink.NLM_F_REQUEST | netlink.NLM_F_MATCH
-
-        # start with a zero-filled buffer padded appropriately
-        buf = ctypes.create_string_buffer(self.hdr.nlmsg_len)
-        ctypes.memmove(buf, ctypes.addressof(self.hdr), netlink.NLMSG_HDRLEN)
-        ctypes.memmove(ctypes.addressof(buf) + netlink.NLMSG_HDRLEN, ctypes.addressof(payload), payload_len)
-
-        ## print("Sending", len(buf.raw), "bytes:")
-        ## print("  ", binascii.hexlify(buf.raw))
-        self.sock.send(buf.raw)
+class ReceiveBuffer(object):
+    """A reusable block of memory that datagrams are received into back to
+    back, so that a whole dump costs one allocation rather than one per
+    datagram.  Views handed out by reserve() are only valid until reset()."""
 
-        self.msg_type = msg_type
+    def __init__(self, size = 256 * 1024):
+        self.block = bytearray(size)
+        self.view = memoryview(self.block)
+        self.offset = 0
 
 
-    def recv_msg(self, maxsize):
-        rdata = self.sock.recv(maxsize)
-        ## print(len(rdata), "bytes received!")
-        return ctypes.create_string_buffer(rdata, len(rdata))
+    def reset(self):
+        self.offset = 0
 
 
-    def transact(self, msg_type, payload):
-        """Sends a request and receives datagrams, returning each one as an
-        element (containing a message list) of an array."""
-        self.send_msg(msg_type, payload)
-        buf = self.recv_msg(8192)
-        msgs = [buf]
+    def reserve(self, size):
+        """Returns a writable view of exactly size bytes."""
+        end = self.offset + decode.align(size)
+        if end > len(self.block):
+            # Views into the old block may still be in use, so rather than
+            # resizing it (which isn't allowed anyway), switch to a new block
+            # big enough that it won't need replacing again for a while
+            self.block = bytearray(max(2 * len(self.block), decode.align(size)))
+            self.view = memoryview(self.block)
+            self.offset = 0
+            end = decode.align(size)
+
+        view = self.view[self.offset:self.offset + size]
+        self.offset = end
+        return view
 
-        hdr = netlink.Nlmsghdr.from_pointer(buf)
-        if hdr.nlmsg_flags == netlink.NLM_F_MULTI:
-            while hdr.nlmsg_type != netlink.NLMSG_DONE:
-                ## print("... message type =", hdr.nlmsg_type)
-                buf = self.recv_msg(8192)
-                msgs.append(buf)
-                hdr = netlink.Nlmsghdr.from_pointer(buf)
 
-        return msgs
+
+class NetlinkSocket(object):
+    # A capture.Capture that every datagram received is written to, if any
+    capture = None
+    # Whether the reply to the last request hasn't been received in full
+    in_progress = False
+    # Whether the kernel flagged the last dump as interrupted by changes,
+    # meaning that it may be inconsistent
+    interrupted = False
+    # How many times transact() repeats an interrupted dump before giving up
+    max_restarts = 5
+    # Bytes received so far, which gives an idea of how big dumps are
+    received = 0
+
+    def __init__(self, proto, groups = 0):
+        """@param groups  A bitmask of multicast groups (e.g. RTMGRP_LINK) to
+                          receive notifications from"""
+        with timing.phase("socket setup"):
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, proto)
+            self.sock.bind((0, groups))
+            # Have the kernel explain errors, if it's new enough
+            try:
+                self.sock.setsockopt(constants.SOL_NETLINK, constants.NETLINK_EXT_ACK, 1)
+            except OSError:
+                pass
+
+        self.rbuf = ReceiveBuffer()
+        self.peek_buf = bytearray(decode.NLMSG_HDRLEN)
+
+        self.seq = 0
+        self.pid = os.getpid()
+        self.msg_type = 0
+        self.request = 0
+
+
+    def close(self):
+        self.sock.close()
+
+
+    def set_rcvbuf(self, size):
+        """Makes the kernel queue up to at least size bytes for the socket,
+        e.g. so that a burst of notifications doesn't overflow it.  Going
+        over net.core.rmem_max needs CAP_NET_ADMIN; without it, the size is
+        capped there."""
+        if self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= size:
+            return
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, constants.SO_RCVBUFFORCE, size)
+        except OSError:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+
+
+    def set_strict_check(self, enable):
+        """Asks the kernel to validate requests strictly, which also makes it
+        honour filters (e.g. ifa_index) in dump requests.  Returns False if
+        the kernel is too old to support this."""
+        try:
+            self.sock.setsockopt(constants.SOL_NETLINK, constants.NETLINK_GET_STRICT_CHK, int(enable))
+        except OSError:
+            return False
+        return True
+
+
+    def send_msg(self, msg_type, payload, flags = constants.NLM_F_DUMP):
+        """@param payload  The request as bytes, e.g. a packed Ifinfomsg
+                           followed by rtattr structures
+        @param flags       NLM_F_* flags to use in addition to NLM_F_REQUEST"""
+        self.seq += 1
+        length = decode.align(decode.NLMSG_HDRLEN + len(payload))
+        hdr = decode.nlmsghdr.pack(length, msg_type, constants.NLM_F_REQUEST | flags,
+                                   self.seq, self.pid)
+
+        # pad appropriately with zeroes
+        buf = (hdr + payload).ljust(length, b'\0')
+        ## print("Sending", len(buf), "bytes:")
+        ## print("  ", buf.hex())
+        self.sock.send(buf)
+
+        self.msg_type = msg_type
+        if self.capture is not None:
+            self.request = self.capture.new_request()
+
+
+    def recv_msg(self):
+        """Receives a datagram straight into the receive buffer and returns a
+        memoryview of it.  This is only valid until the next transact()."""
+        # Find out how big the datagram really is without consuming it, so
+        # that large ones are never truncated
+        size = self.sock.recv_into(self.peek_buf, 0, socket.MSG_PEEK | socket.MSG_TRUNC)
+        view = self.rbuf.reserve(size)
+        size = self.sock.recv_into(view, size)
+        ## print(size, "bytes received!")
+        self.received += size
+        if self.capture is not None:
+            self.capture.write(self.request, self.msg_type, view[:size])
+        if timing.stats is not None:
+            timing.stats.count("datagrams")
+            timing.stats.count("bytes received", size)
+        return view[:size]
+
+
+    def start(self, msg_type, payload, flags = constants.NLM_F_DUMP):
+        """Sends a request, the reply to which is then received by calling
+        recv_part() until it says it's finished."""
+        if self.in_progress:
+            # The kernel won't start another dump until the last one has
+            # been read, so discard the rest of it
+            while not self.recv_part(True)[1]:
+                pass
+        self.rbuf.reset()
+        self.send_msg(msg_type, payload, flags)
+        self.in_progress = True
+        self.interrupted = False
+
+
+    def recv_part(self, reuse = False):
+        """Receives the next datagram of a reply and returns it along with a
+        flag that is True if it's the last one.  Datagrams with a different
+        sequence number (i.e. left over from an earlier request) are skipped.
+        @param reuse  If True, overwrite the previous datagram, which must
+                      not be used afterwards; this keeps memory use flat"""
+        while True:
+            if reuse:
+                self.rbuf.reset()
+            buf = self.recv_msg()
+            # Newer kernels may put NLMSG_DONE at the end of a datagram that
+            # also contains data, so check every message
+            for hdr_type, hdr_flags, seq, chunk in decode.messages(buf):
+                ## print("... message type =", hdr_type)
+                if seq != self.seq:
+                    # The reply to an earlier request wasn't read to the end
+                    # (e.g. because of an exception)
+                    break
+                if hdr_flags & constants.NLM_F_DUMP_INTR:
+                    self.interrupted = True
+                if not hdr_flags & constants.NLM_F_MULTI or hdr_type == constants.NLMSG_DONE:
+                    self.in_progress = False
+                    return buf, True
+            else:
+                return buf, False
+
+
+    def transact(self, msg_type, payload, flags = constants.NLM_F_DUMP):
+        """Sends a request and receives datagrams, returning each one as an
+        element (containing a message list) of an array.  The elements are
+        views into the socket's receive buffer, so they must be processed
+        before the next call.  A dump that the kernel says was interrupted by
+        changes is started again, up to max_restarts times, after which
+        OSError (EINTR) is raised."""
+        with timing.phase("dump " + timing.kind(constants.RTM_FAM(msg_type))):
+            for attempt in range(self.max_restarts + 1):
+                self.start(msg_type, payload, flags)
+
+                msgs = []
+                finished = False
+                while not finished:
+                    buf, finished = self.recv_part()
+                    msgs.append(buf)
+                if not self.interrupted:
+                    return msgs
+                # Something changed during the dump, so start again
+                if timing.stats is not None:
+                    timing.stats.count("dumps restarted")
+
+        raise interrupted_error()
+
+
+    def transact_iter(self, msg_type, payload, flags = constants.NLM_F_DUMP):
+        """Like transact(), but generates each datagram as it arrives.  The
+        receive buffer is reused, so each one is only valid until the next is
+        generated, but memory use stays flat however long the reply is.
+        Raises OSError (EINTR) at the end if the dump was interrupted."""
+        self.start(msg_type, payload, flags)
+
+        finished = False
+        while not finished:
+            buf, finished = self.recv_part(True)
+            yield buf
+        # It's too late to start again
+        if self.interrupted:
+            raise interrupted_error()
 
 
     def process_messages(self, buf, fn, *args):
-        """Calls fn on each message in the buffer, passing a pointer to the
+        """Calls fn on each message in the buffer, passing a view of the
         "sub-buffer", i.e. the data after the Nlmsghdr."""
 
         return_values = []
 
-        if len(buf) > 0:
-            # store this on the stack because the object's property might
-            # change due to recursive processing
-            expected_type = self.msg_type
-
-            # buffer contains messages, each with their own Nlmsghdr
-            # ...then comes a sub-header (e.g. Ifinfomsg) followed by a number of Rtattr
-
-            buf_ptr = ctypes.cast(buf, ctypes.c_void_p)
-            # ptr walks through the buffer, pointing at each message
-            ptr = buf_ptr
-            while ptr.value - buf_ptr.value < len(buf):
-                ## print("Processed %d of %d bytes" % (ptr.value - buf_ptr.value, len(buf)))
-                # Map a header pointer to the start of the message
-                hdr = netlink.Nlmsghdr.from_pointer(ptr)
-                ## print("internal message len = ", hdr.nlmsg_len)
-                ## print("message type = %d [%d]" % (hdr.nlmsg_type, hdr.nlmsg_seq))
-                if hdr.nlmsg_type != netlink.NLMSG_DONE:
+        # store this on the stack because the object's property might
+        # change due to recursive processing
+        expected_family = constants.RTM_FAM(self.msg_type)
+
+        # buffer contains messages, each with their own Nlmsghdr
+        # ...then comes a sub-header (e.g. Ifinfomsg) followed by a number of Rtattr
+        kind = timing.kind(expected_family)
+        with timing.phase("parse " + kind):
+            for msg_type, flags, seq, chunk in decode.messages(buf):
+                ## print("message type = %d [%d]" % (msg_type, seq))
+                if msg_type == constants.NLMSG_ERROR or msg_type == constants.NLMSG_DONE:
+                    # A dump can also fail part-way, in which case NLMSG_DONE
+                    # carries the error; 0 is just an ACK or the end
+                    error, ext_ack = decode.error(chunk, flags, msg_type == constants.NLMSG_DONE)
+                    if error:
+                        raise netlink_error(error, ext_ack)
+                else:
                     # Compare the RTNL_FAMILY_* values of the request and response
-                    ## print("fam = %d (expected %d)" % (rtnl.RTM_FAM(hdr.nlmsg_type), rtnl.RTM_FAM(expected_type)))
-                    if rtnl.RTM_FAM(hdr.nlmsg_type) != rtnl.RTM_FAM(expected_type):
-                        if rtnl.RTM_FAM(expected_type) == families.RTNL_FAMILY_ADDR and \
-                           rtnl.RTM_FAM(hdr.nlmsg_type) == families.RTNL_FAMILY_LINK:
-                            print("extra link message")
+                    family = constants.RTM_FAM(msg_type)
+                    if family != expected_family:
+                        if expected_family == families.RTNL_FAMILY_ADDR and \
+                           family == families.RTNL_FAMILY_LINK:
+                            # Seen occasionally; harmless
+                            if timing.stats is not None:
+                                timing.stats.count("messages ignored")
                         else:
-                            print("bad type! (%s)" % hdr.nlmsg_type, file=sys.stderr)
-                            sys.exit(3)
+                            raise OSError(errno.EPROTO, "Unexpected reply message type %d" % msg_type)
                     else:
                         # Process the message
-                        # Map a message pointer into the buffer, starting after the header
-                        # Due to the pointer type created, effectively a sub-buffer is passed
-                        return_values.append(
-                          fn(self, ctypes.cast(netlink.NLMSG_DATA(hdr), 
-                                               ctypes.POINTER((ctypes.c_ubyte * netlink.NLMSG_PAYLOAD(hdr, 0)))), *args))
+                        return_values.append(fn(self, chunk, *args))
 
-                # Advance the pointer to the next message
-                ptr = ctypes.c_void_p(ptr.value + hdr.nlmsg_len)
+        if timing.stats is not None:
+            timing.stats.count("messages " + kind, len(return_values))
 
         return return_values
 
 
     def process_rta_chain(self, data, table, meta = None):
-        """Deals with a sequence of rtattr structures.
-        @param data     A ctypes array containing the structures
-        @param table    An associative array mapping rta_type IDs to one of the following:
-                          - a function, i.e. fn(id, data, meta) that returns a tuple consisting of a property name and a value
-                          - OR a tuple consisting of a property name and a similar table showing how to process nesting rtattr structures
-        @param meta     Optional information passed down the call tree
-        @return         An associative array of property names mapping to info values
-        """
-
-        return_values = {}
-
-        # Find the first Rtattr
-        bytes_remaining = len(data.contents)
-        attr = rtnl.Rtattr.from_address(ctypes.addressof(data.contents))
-
-        while bytes_remaining > 0:
-            ## print(attr.rta_type)
-            if attr.rta_type in table:
-                if type(table[attr.rta_type]) == types.FunctionType:
-                    label, info = table[attr.rta_type](attr.rta_type, rtnl.RTA_DATA(attr), meta)
-                    return_values[label] = info
-                else:
-                    label, subtable = table[attr.rta_type]
-                    return_values[label] = self.process_rta_chain(rtnl.RTA_DATA(attr), subtable, meta)
-            else:
-                # use this tables's default handler function, if any
-                if if_addr.IFA_UNSPEC in table:
-                    label, info = table[if_addr.IFA_UNSPEC](attr.rta_type, rtnl.RTA_DATA(attr), meta)
-                    return_values[label] = info
+        """See util.process_rta_chain()."""
+        return util.process_rta_chain(data, table, meta)
 
-            # advance to the next Rtattr
-            attr, bytes_remaining = rtnl.RTA_NEXT(attr, bytes_remaining)
 
-        return return_values
+# *** FUNCTIONS ***
+def netlink_error(error, ext_ack = None):
+    """Returns an OSError for an errno value (and extended ACK text, if any)
+    from the kernel."""
+    if ext_ack:
+        return OSError(error, "%s (%s)" % (os.strerror(error), ext_ack))
+    return OSError(error, os.strerror(error))
+
+
+def interrupted_error():
+    return OSError(errno.EINTR, "Dump kept being interrupted by changes")
 
 
-# *** FUNCTIONS ***
 def show_help(dest=sys.stdout):
     print(__doc__, end='', file=dest)
 
@@ -210,20 +402,20 @@ def report_notice(*msg):
 # (Invoke with "python -m shepherd" under Python 2.7+, otherwise
 # "python -m shepherd.__main__")
 
-def main(argv):
-    """Acts like main() in a C program.  Return value is used as program exit code."""
+def parse_options(argv):
+    """Sets params from the command line.  Returns the remaining arguments, or
+    an exit code if the program should stop."""
 
     global params
 
     # == Command-line parsing ==
     # -- defaults --
-    debug = 0
-    params['blank-lines'] = True
-    params['verbose'] = 0
+    params.reset()
+    sort_fields = []
 
     # -- option handling --
     try:
-        optlist, args = getopt.getopt(argv[1:], allowed_options, allowed_long_options)
+        optlist, args = getopt.gnu_getopt(argv[1:], allowed_options, allowed_long_options)
     except getopt.GetoptError as e:
         report_error(e)
         return 1
@@ -233,36 +425,293 @@ def main(argv):
             params['state-sort'] = True
         if option == "-i" or option == "--id-sort":
             params['id-sort'] = True
+        if option == "-S" or option == "--sort":
+            from . import interface
+            for field in opt_arg.split(','):
+                if field not in interface.sort_fields:
+                    report_error("Unknown sort field '%s'" % field)
+                    return 1
+                sort_fields.append(field)
         if option == "-g" or option == "--no-grouping":
             params['no-grouping'] = True
         if option == "-c" or option == "--compact":
             params['blank-lines'] = False
+        elif option == "-p" or option == "--parallel":
+            params['parallel'] = True
+        elif option == "--stream":
+            params['stream'] = True
+        elif option == "-n" or option == "--count":
+            try:
+                params['count'] = int(opt_arg)
+            except ValueError:
+                params['count'] = 0
+            if params['count'] <= 0:
+                report_error("Invalid count '%s'" % opt_arg)
+                return 1
+        elif option == "--interval":
+            try:
+                params['interval'] = float(opt_arg)
+            except ValueError:
+                params['interval'] = 0
+            if params['interval'] <= 0:
+                report_error("Invalid interval '%s'" % opt_arg)
+                return 1
+        elif option == "--state":
+            from . import neigh
+            for state in opt_arg.split(','):
+                if state not in neigh.state_bits:
+                    report_error("Unknown neighbour state '%s'" % state)
+                    return 1
+                params['nud-states'] |= neigh.state_bits[state]
+        elif option == "--all-netns":
+            params['all-netns'] = True
+        elif option == "--json":
+            params['format'] = 'json'
+        elif option == "--ndjson":
+            params['format'] = 'ndjson'
+        elif option == "--capture":
+            params['capture'] = opt_arg
+        elif option == "--replay":
+            params['replay'] = opt_arg
+        elif option == "--client":
+            params['client'] = True
+        elif option == "--socket":
+            params['socket'] = opt_arg
         elif option == "-v" or option == "--verbose":
             params['verbose'] += 1
+        elif option == "--timings":
+            params['timings'] = True
+        elif option == "--stats":
+            params['stats'] = True
         elif option == "-d":
-            debug += 1
+            params['debug'] += 1
+            params['timings'] = params['stats'] = True
         elif option == "-h" or option == "--help":
             show_help()
             return 0
 
+    # State sorting takes precedence over other fields, which are followed by
+    # the ID or name to break ties
+    if params['state-sort']:
+        sort_fields.insert(0, 'state')
+    sort_fields.append('id' if params['id-sort'] else 'name')
+    params['sort'] = sort_fields
+
+    return args
+
+
+def main(argv):
+    """Acts like main() in a C program.  Return value is used as program exit code."""
+
+    args = parse_options(argv)
+    if type(args) is int:
+        return args
+
+    if params['client']:
+        # Let the server do everything
+        from . import server
+        if params['socket'] is None:
+            params['socket'] = server.default_path()
+        try:
+            return server.query(params['socket'], argv)
+        except OSError as e:
+            report_error("Can't query server at %s: %s" % (params['socket'], e.strerror))
+            return 1
+
+    if params['timings'] or params['stats']:
+        timing.start()
+        try:
+            return run_command(args)
+        finally:
+            timing.stats.report(params['timings'], params['stats'], params['format'] in ('json', 'ndjson'))
+    else:
+        return run_command(args)
+
+
+def run_command(args):
+    """Does the work of main() once the options have been dealt with."""
+
     # -- argument checking --
     ## if len(args) not in (2, 3):
     ##     report_error("Invalid command-line parameters.")
     ##     show_help(sys.stderr)
     ##     return 1
 
-    s = NetlinkSocket(socket.NETLINK_ROUTE)
+    if len(args) > 0 and args[0] in commands:
+        command = args.pop(0)
+    else:
+        command = "list"
+
+    if params['capture'] or params['replay']:
+        # Replies are replayed one request at a time, so nothing that uses
+        # more than one socket at once can be captured
+        if command in ('monitor', 'serve'):
+            report_error("--capture and --replay can't be used with %s" % command)
+            return 1
+        elif params['parallel'] or params['stream'] or params['all-netns']:
+            report_error("--capture and --replay can't be used with -p, --stream or --all-netns")
+            return 1
+        from . import capture
+    if params['capture']:
+        try:
+            NetlinkSocket.capture = capture.Capture(params['capture'])
+        except OSError as e:
+            report_error("%s: %s" % (params['capture'], e.strerror))
+            return 1
+    if params['replay']:
+        try:
+            s = capture.ReplaySocket(params['replay'])
+        except OSError as e:
+            report_error("%s: %s" % (params['replay'], e.strerror))
+            return 1
+    else:
+        s = NetlinkSocket(socket.NETLINK_ROUTE)
     ## iplist.get_addr(s)
-    interfaces = iplist.get_interfaces(s)
-    addrs_by_interface = iplist.get_addrs(s, interfaces)
 
-    if len(args) == 1:
-        matching_ids = [i for i in interfaces if interfaces[i].info['name'] == args[0]]
-        matching_interfaces = {}
-        for i in matching_ids:
-            matching_interfaces[i] = interfaces[i]
-        iplist.show_links(matching_interfaces, addrs_by_interface)
+    if command == "monitor":
+        from . import monitor
+        # Subscribe before the initial dump so that no changes are missed
+        return monitor.monitor(NetlinkSocket(socket.NETLINK_ROUTE, monitor.groups), s)
+    elif command == "neigh":
+        from . import neigh
+        try:
+            return neigh.show_neighbours(s, args[0] if args else None, params['nud-states'])
+        except OSError as e:
+            report_error("%s: %s" % (args[0] if args else command, e.strerror))
+            return 1
+    elif command == "route-get":
+        from . import route
+        try:
+            return route.route_get(s, args)
+        except OSError as e:
+            # Only errors reading the files have a filename
+            if e.filename is not None:
+                report_error("%s: %s" % (e.filename, e.strerror))
+            else:
+                report_error(e.strerror)
+            return 1
+    elif command == "find" or command == "addrs":
+        from . import addrindex
+        try:
+            if command == "find":
+                return addrindex.show_find(s, args)
+            else:
+                return addrindex.show_addrs(s)
+        except OSError as e:
+            report_error(e.strerror)
+            return 1
+    elif command == "tree":
+        from . import topology
+        try:
+            return topology.show_tree(s, args[0] if args else None)
+        except OSError as e:
+            report_error("%s: %s" % (args[0] if args else command, e.strerror))
+            return 1
+    elif command == "top":
+        from . import top
+        try:
+            return top.top(s)
+        except OSError as e:
+            report_error(e.strerror)
+            return 1
+    elif command == "serve":
+        from . import monitor
+        from . import server
+        return server.serve(NetlinkSocket(socket.NETLINK_ROUTE, monitor.groups), s,
+                            params['socket'] or server.default_path(), list_from_model)
+
+    from . import iplist
+    if params['all-netns']:
+        return list_all_netns(args)
+    elif len(args) == 1:
+        # Have the kernel do the filtering rather than dumping everything
+        try:
+            interfaces = iplist.get_interface(s, name=args[0])
+        except OSError as e:
+            report_error("%s: %s" % (args[0], e.strerror))
+            return 1
+        index, = interfaces.keys()
+        addrs_by_interface = iplist.get_addrs(s, interfaces, index=index)
+    elif params['stream']:
+        from . import stream
+        addr_socks = { socket.AF_INET: NetlinkSocket(socket.NETLINK_ROUTE),
+                       socket.AF_INET6: NetlinkSocket(socket.NETLINK_ROUTE) }
+        try:
+            iplist.stream_links(stream.get_interfaces_and_addrs(s, addr_socks))
+        except OSError as e:
+            report_error(e.strerror)
+            return 1
+        return 0
     else:
-        iplist.show_links(interfaces, addrs_by_interface)
+        try:
+            if params['parallel']:
+                from . import parallel
+                addr_socks = { socket.AF_INET: NetlinkSocket(socket.NETLINK_ROUTE),
+                               socket.AF_INET6: NetlinkSocket(socket.NETLINK_ROUTE) }
+                interfaces, addrs_by_interface = parallel.get_interfaces_and_addrs(s, addr_socks)
+            else:
+                interfaces = iplist.get_interfaces(s)
+                addrs_by_interface = iplist.get_addrs(s, interfaces)
+        except OSError as e:
+            # e.g. the dump kept being interrupted, or a capture file being
+            # replayed doesn't have the replies
+            report_error(e.strerror)
+            return 1
+
+    iplist.show_links(interfaces, addrs_by_interface)
 
     ## print(addrs_by_interface.keys())
+
+
+def list_all_netns(args):
+    """Acts like main() for the list command with --all-netns."""
+
+    from . import iplist
+    from . import render
+    from . import netns
+
+    results, failures = netns.get_all(lambda: NetlinkSocket(socket.NETLINK_ROUTE), netns.discover())
+    for label, e in failures:
+        report_warning("Can't dump network namespace %s: %s" % (label, e.strerror))
+
+    r = render.make_renderer()
+    found = False
+    for label, interfaces, addrs_by_interface in results:
+        if len(args) == 1:
+            interfaces = dict((index, i) for index, i in interfaces.items() if i.name == args[0])
+        found = found or bool(interfaces)
+        iplist.show_links(interfaces, addrs_by_interface, r)
+    r.flush()
+
+    if len(args) == 1 and not found:
+        report_error("%s: %s" % (args[0], os.strerror(errno.ENODEV)))
+        return 1
+    return 0
+
+
+def list_from_model(model, argv):
+    """Acts like main() for the list command, using a monitor.Model rather
+    than dumping anything.  Used by the server to answer queries."""
+
+    from . import iplist
+
+    args = parse_options(argv)
+    if type(args) is int:
+        return args
+
+    if len(args) > 0 and args[0] in commands:
+        command = args.pop(0)
+        if command != "list":
+            report_error("The server can't run the '%s' command" % command)
+            return 1
+
+    if len(args) == 1:
+        interfaces = dict((index, i) for index, i in model.interfaces.items() if i.name == args[0])
+        if not interfaces:
+            report_error("%s: %s" % (args[0], os.strerror(errno.ENODEV)))
+            return 1
+    else:
+        interfaces = model.interfaces
+
+    iplist.show_links(interfaces, model.addrs_by_interface)
+    return 0
@@ -0,0 +1,82 @@
+import socket
+
+from . import record
+from . import decode
+from . import constants
+
+
+# Functions that decode each lazily-decoded field (see record.Record)
+def decode_flags(a):
+    # IFA_FLAGS overrides ifaddrmsg.ifa_flags
+    data = a.attr(constants.IFA_FLAGS)
+    if data is not None:
+        return decode.u32.unpack_from(data)[0]
+    return decode.ifaddrmsg.unpack_from(a.raw)[2]
+
+
+def local_attr(a):
+    # The kernel sends IFA_LOCAL for IPv4 and for IPv6 addresses with a peer
+    # (which is then in IFA_ADDRESS); otherwise IFA_ADDRESS is the local
+    # address, even on point-to-point links (e.g. IPv6 on a tun)
+    data = a.attr(constants.IFA_LOCAL)
+    if data is None:
+        data = a.attr(constants.IFA_ADDRESS)
+    return data
+
+
+def decode_addr(a):
+    data = local_attr(a)
+    return socket.inet_ntop(a.family, data) if data is not None else None
+
+
+def decode_remote_addr(a):
+    # IFA_ADDRESS is only the remote end if it isn't the local address
+    local = a.attr(constants.IFA_LOCAL)
+    data = a.attr(constants.IFA_ADDRESS)
+    if local is None or data is None or local == data:
+        return None
+    return socket.inet_ntop(a.family, data)
+
+
+def decode_name(a):
+    data = a.attr(constants.IFA_LABEL)
+    return decode.string(data) if data is not None else None
+
+
+
+class Address(record.Record):
+    """Info about one address belonging to an interface.  Attributes that
+    weren't supplied by the kernel are None.  Only interface, family,
+    prefix and scope are set up front; the rest are decoded from the message
+    when first read."""
+
+    __slots__ = ('interface', 'family', 'prefix', 'scope', 'flags', 'addr',
+                 'remote_addr', 'name')
+
+    decoders = { 'flags':	decode_flags,
+                 'addr':	decode_addr,
+                 'remote_addr':	decode_remote_addr,
+                 'name':	decode_name }
+    attr_types = frozenset((constants.IFA_LABEL, constants.IFA_ADDRESS, constants.IFA_LOCAL,
+                            constants.IFA_FLAGS))
+    kind = "addr"
+
+    def __init__(self, interface, family, prefix, scope, chunk):
+        """@param chunk  A view of the message, starting with the ifaddrmsg"""
+        self.interface = interface
+        self.family = family
+        self.prefix = prefix
+        self.scope = scope
+        self.index_attrs(chunk, decode.IFADDRMSG_LEN)
+
+
+    def addr_int(self):
+        """Returns the local address as an integer (without decoding it as a
+        string), or None."""
+        data = local_attr(self)
+        return int.from_bytes(data, 'big') if data is not None else None
+
+
+    def key(self):
+        """Identifies the address among those belonging to its interface."""
+        return (self.family, self.addr, self.remote_addr, self.prefix)
@@ -0,0 +1,144 @@
+"""Indexes the addresses from an address dump by their integer value, so
+that the interfaces owning an address, or having addresses inside a prefix,
+can be found by binary search rather than by comparing strings.  The same
+index lists all the addresses in order (iptool addrs).
+
+Addresses whose message has neither IFA_LOCAL nor IFA_ADDRESS are left out,
+as there's nothing to index them by.
+"""
+
+import bisect
+import operator
+
+from . import iplist
+from . import route
+from . import render
+
+
+# How many results to buffer before writing them out
+batch_size = 1024
+
+
+class AddressIndex(object):
+    """For each family, keeps a list of addresses as integers in ascending
+    order, along with a list of the Address objects in the same order."""
+
+    def __init__(self, addrs_by_interface):
+        entries = {}
+        for addrs in addrs_by_interface.values():
+            for a in addrs:
+                key = a.addr_int()
+                if key is not None:
+                    entries.setdefault(a.family, []).append((key, a))
+
+        self.keys = {}
+        self.addrs = {}
+        for family, pairs in entries.items():
+            pairs.sort(key=operator.itemgetter(0))
+            self.keys[family] = [key for key, a in pairs]
+            self.addrs[family] = [a for key, a in pairs]
+
+
+    def within(self, family, first, last):
+        """Returns the Address objects from first to last (as integers)
+        inclusive, in order."""
+        keys = self.keys.get(family)
+        if keys is None:
+            return []
+        start = bisect.bisect_left(keys, first)
+        end = bisect.bisect_right(keys, last, start)
+        return self.addrs[family][start:end]
+
+
+    def owners(self, family, addr):
+        """Returns the Address objects for an address (given as an integer),
+        which may belong to more than one interface."""
+        return self.within(family, addr, addr)
+
+
+    def all(self):
+        """Generates every Address object, IPv4 first, in order."""
+        for family in sorted(self.addrs):
+            for a in self.addrs[family]:
+                yield a
+
+
+
+def parse_query(text):
+    """Returns a (family, first, last) tuple giving the range of addresses
+    (as integers) covered by an address or a prefix (e.g. 10.0.0.0/8).
+    Raises ValueError if it isn't valid."""
+    addr, slash, length = text.partition('/')
+    try:
+        family, first = route.parse_addr(addr)
+    except OSError:
+        raise ValueError(text)
+    bits = route.address_bits[family]
+    length = int(length) if slash else bits
+    if not 0 <= length <= bits:
+        raise ValueError(text)
+    host_mask = (1 << (bits - length)) - 1
+    first &= ~host_mask
+    return family, first, first | host_mask
+
+
+def find(index, interfaces, queries):
+    """Generates an associative array describing the addresses found for
+    each query (an address or a prefix)."""
+    for text in queries:
+        try:
+            family, first, last = parse_query(text)
+        except ValueError:
+            yield { 'query': text, 'error': "invalid address or prefix" }
+            continue
+
+        matches = index.within(family, first, last)
+        if not matches:
+            yield { 'query': text, 'error': "not found" }
+            continue
+        yield { 'query': text,
+                'matches': [render.located_addr_record(a, dev_name(interfaces, a.interface))
+                            for a in matches] }
+
+
+def dev_name(interfaces, index):
+    i = interfaces.get(index)
+    return i.name if i is not None else "if%d" % index
+
+
+def get_index(s):
+    """Dumps the interfaces and addresses, and returns the interfaces along
+    with an AddressIndex."""
+    interfaces = iplist.get_interfaces(s)
+    return interfaces, AddressIndex(iplist.get_addrs(s, interfaces))
+
+
+def show_find(s, queries):
+    """Shows the interfaces owning each address, or having addresses inside
+    each prefix, in queries (or read from stdin if there are none)."""
+    interfaces, index = get_index(s)
+
+    r = render.make_renderer()
+    count = 0
+    for record in find(index, interfaces, queries or route.read_addrs(["-"])):
+        r.found(record)
+        count += 1
+        if r.incremental and count % batch_size == 0:
+            r.flush()
+    r.flush()
+    return 0
+
+
+def show_addrs(s):
+    """Shows every address, sorted by address."""
+    interfaces, index = get_index(s)
+
+    r = render.make_renderer()
+    count = 0
+    for a in index.all():
+        r.address(a, dev_name(interfaces, a.interface))
+        count += 1
+        if r.incremental and count % batch_size == 0:
+            r.flush()
+    r.flush()
+    return 0
@@ -0,0 +1,158 @@
+"""Dumps from the kernel without blocking an asyncio event loop.  Each
+AsyncNetlinkSocket is non-blocking and waits for datagrams using
+loop.add_reader(), so while a dump is in progress other tasks keep running,
+and dumps on different sockets overlap with each other and with other I/O.
+
+The kernel only runs one dump at a time per socket, so use a socket for each
+dump that is to run concurrently:
+
+    async def show():
+        link_sock, addr_sock = aio.AsyncNetlinkSocket(), aio.AsyncNetlinkSocket()
+        interfaces, addrs_by_interface = \\
+            await aio.get_interfaces_and_addrs(link_sock, { socket.AF_UNSPEC: addr_sock })
+        async for r in aio.routes(aio.AsyncNetlinkSocket()):
+            ...
+"""
+
+import socket
+import asyncio
+
+from . import NetlinkSocket, interrupted_error
+from . import iplist
+from . import parallel
+from . import decode
+from . import constants
+
+
+class AsyncNetlinkSocket(NetlinkSocket):
+    def __init__(self, proto = socket.NETLINK_ROUTE, groups = 0):
+        NetlinkSocket.__init__(self, proto, groups)
+        self.sock.setblocking(False)
+
+
+    async def wait_readable(self):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.sock.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+
+
+    async def recv_part_async(self, reuse = False):
+        """Like recv_part(), but waits for the datagram without blocking."""
+        while True:
+            try:
+                part = self.recv_part(reuse)
+            except BlockingIOError:
+                await self.wait_readable()
+                continue
+            # The kernel makes the next part of a dump as soon as the last
+            # one is read, so there may never be any waiting; let other
+            # tasks run anyway
+            await asyncio.sleep(0)
+            return part
+
+
+    async def start_async(self, msg_type, payload, flags = constants.NLM_F_DUMP):
+        """Like start(), but discards the rest of an unfinished reply (e.g.
+        from a records() iteration that was abandoned) without blocking."""
+        while self.in_progress:
+            await self.recv_part_async(True)
+        self.start(msg_type, payload, flags)
+
+
+    async def transact_async(self, msg_type, payload, flags = constants.NLM_F_DUMP):
+        """Like transact(): returns a list of datagrams, which are views into
+        the receive buffer and so must be processed before the next
+        request, starting again if the dump is interrupted."""
+        for attempt in range(self.max_restarts + 1):
+            await self.start_async(msg_type, payload, flags)
+            msgs = []
+            finished = False
+            while not finished:
+                buf, finished = await self.recv_part_async()
+                msgs.append(buf)
+            if not self.interrupted:
+                return msgs
+
+        raise interrupted_error()
+
+
+    async def records(self, msg_type, payload, fn, *args):
+        """Sends a dump request and generates the result of calling fn on each
+        message (as process_messages() does) as datagrams arrive, skipping
+        results that are None.  The receive buffer is reused, so memory use
+        stays flat however long the reply is.  Raises OSError (EINTR) at
+        the end if the dump was interrupted."""
+        await self.start_async(msg_type, payload)
+        finished = False
+        while not finished:
+            buf, finished = await self.recv_part_async(True)
+            for record in self.process_messages(buf, fn, *args):
+                if record is not None:
+                    yield record
+        if self.interrupted:
+            raise interrupted_error()
+
+
+
+def links(s):
+    """Returns an async iterator over Interface objects."""
+    return s.records(constants.RTM_GETLINK, iplist.link_payload(), iplist.get_link_info)
+
+
+def addrs(s, interfaces, family = socket.AF_UNSPEC):
+    """Returns an async iterator over Address objects, skipping any belonging
+    to interfaces not in interfaces (an associative array indexed by ID)."""
+    return s.records(constants.RTM_GETADDR, parallel.family_payload(family),
+                     iplist.get_addr_info, interfaces)
+
+
+def routes(s):
+    """Returns an async iterator over route.Route objects."""
+    from . import route
+    payload = decode.rtmsg.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0, 0, 0, 0)
+    return s.records(constants.RTM_GETROUTE, payload, route.Route)
+
+
+async def get_interfaces(s):
+    """Returns an associative array like iplist.get_interfaces() does."""
+    return dict([(i.id, i) async for i in links(s)])
+
+
+async def get_routes(s):
+    """Returns a route.RouteIndex like route.get_routes() does."""
+    from . import route
+    index = route.RouteIndex()
+    async for r in routes(s):
+        index.add(r)
+
+    return index
+
+
+async def get_interfaces_and_addrs(link_sock, addr_socks):
+    """Like parallel.get_interfaces_and_addrs(), but the dumps run on the
+    event loop, with links being decoded while addresses are received.
+    @param addr_socks  An associative array mapping address families (e.g.
+                       socket.AF_INET, or socket.AF_UNSPEC for all) to the
+                       AsyncNetlinkSocket to use for each
+    """
+    addr_dumps = [asyncio.create_task(s.transact_async(constants.RTM_GETADDR,
+                                                       parallel.family_payload(family)))
+                  for family, s in addr_socks.items()]
+    try:
+        # Address info depends on the interface flags, so links come first
+        interfaces = await get_interfaces(link_sock)
+        addrs_by_interface = {}
+        for s, dump in zip(addr_socks.values(), addr_dumps):
+            for buf in await dump:
+                iplist.collect_addrs(s, [buf], interfaces, addrs_by_interface)
+                await asyncio.sleep(0)
+    finally:
+        for dump in addr_dumps:
+            dump.cancel()
+
+    return interfaces, addrs_by_interface
@@ -0,0 +1,141 @@
+"""Lets other Python programs (e.g. a long-running agent) query interfaces,
+addresses, neighbours and routes without going through main().
+
+Options are passed explicitly as globals.Options objects rather than through
+params, and netlink sockets are drawn from a bounded SocketPool, so queries
+can be made from many threads at once.  Each socket is only used by one
+query at a time, and the records returned don't refer to the socket or its
+receive buffer, so they can be kept and shared freely.
+
+    from iptool import api
+    for i, addrs in api.links(options=api.Options(sort=['state', 'name'])):
+        print(i.name, [a.addr for a in addrs])
+"""
+
+import socket
+import threading
+import contextlib
+
+from . import NetlinkSocket
+from . import iplist
+from . import render
+from .globals import Options
+
+
+# How many sockets the default pool keeps open at most
+default_pool_size = 4
+
+
+class SocketPool(object):
+    """Hands out up to size NetlinkSockets at once, blocking when they're all
+    in use.  Sockets are only opened when needed, and are kept open for
+    reuse afterwards."""
+
+    def __init__(self, size = default_pool_size):
+        self.idle = []
+        self.lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(size)
+
+
+    @contextlib.contextmanager
+    def socket(self):
+        """A context manager that provides a socket for the duration of a
+        query.  If the query fails, the socket is closed rather than reused,
+        in case it's in an odd state (e.g. strict checking left on)."""
+        self.available.acquire()
+        try:
+            with self.lock:
+                s = self.idle.pop() if self.idle else None
+            if s is None:
+                s = NetlinkSocket(socket.NETLINK_ROUTE)
+
+            try:
+                yield s
+            except BaseException:
+                s.close()
+                raise
+            with self.lock:
+                self.idle.append(s)
+        finally:
+            self.available.release()
+
+
+    def close(self):
+        """Closes the sockets that aren't in use."""
+        with self.lock:
+            for s in self.idle:
+                s.close()
+            self.idle = []
+
+
+
+default_pool = SocketPool()
+
+
+def links(name = None, options = None, pool = None):
+    """Returns a list of (Interface, Address list) tuples, sorted as options
+    (a globals.Options) says.  Raises OSError (e.g. ENODEV) if name is given
+    and there's no such interface."""
+    with (pool or default_pool).socket() as s:
+        if name is not None:
+            interfaces = iplist.get_interface(s, name=name)
+            index, = interfaces.keys()
+            addrs_by_interface = iplist.get_addrs(s, interfaces, index=index)
+        else:
+            interfaces = iplist.get_interfaces(s)
+            addrs_by_interface = iplist.get_addrs(s, interfaces)
+
+    return [(i, addrs_by_interface.get(i.id, []))
+            for i in iplist.sort_links(interfaces, options or Options())]
+
+
+def show_links(pairs, options = None, dest = None):
+    """Writes (Interface, Address list) tuples (e.g. from links()) to dest,
+    by default stdout, in the format options says."""
+    r = render.make_renderer(options or Options(), dest)
+    for i, addrs in pairs:
+        r.link(i, addrs)
+    r.flush()
+
+
+def neighbours(name = None, states = 0, pool = None):
+    """Returns a list of neigh.Neighbour objects, optionally only for the
+    interface called name and in the NUD_* states given.  Raises OSError if
+    there's no such interface."""
+    from . import neigh
+    with (pool or default_pool).socket() as s:
+        index = None
+        if name is not None:
+            index, = iplist.get_interface(s, name=name).keys()
+        return list(neigh.get_neighbours(s, index, states))
+
+
+def route_get(addrs, pool = None):
+    """Returns a list of associative arrays describing the route to each
+    address, like "iptool route-get"."""
+    from . import route
+    with (pool or default_pool).socket() as s:
+        interfaces = iplist.get_interfaces(s)
+        index = route.get_routes(s)
+    return list(route.resolve(index, interfaces, addrs))
+
+
+def find(queries, pool = None):
+    """Returns a list of associative arrays describing the addresses found
+    for each address or prefix, like "iptool find"."""
+    from . import addrindex
+    with (pool or default_pool).socket() as s:
+        interfaces, index = addrindex.get_index(s)
+    return list(addrindex.find(index, interfaces, queries))
+
+
+def tree(name = None, options = None, pool = None):
+    """Returns a list of associative arrays describing the tree of interfaces
+    under the one called name, or the trees covering all of them, like
+    "iptool tree".  Raises OSError if there's no such interface."""
+    from . import topology
+    with (pool or default_pool).socket() as s:
+        t, index = topology.get_topology(s, name, options or Options())
+    if index is not None:
+        return [t.subtree(index)]
+    return list(t.forest())
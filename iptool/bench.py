@@ -0,0 +1,298 @@
+"""Measures how iptool performs on this host.
+
+Usage: python3 -m iptool.bench [ --startup [ --budget=<ms> ] ]
+       python3 -m iptool.bench --stages [ --sizes=<counts> ] [ --threshold=<percent> ]
+                               [ --baseline=<file> ] [ --save-baseline=<file> ] [ --warn-only ]
+
+Reports the memory used by each Interface and Address record (including its
+share of the index that holds it), as measured by tracemalloc.
+
+With --startup, instead checks how long it takes to import what the default
+list command needs (as reported by "python -X importtime"), failing if that
+exceeds the budget or if modules that only other commands need get loaded.
+
+With --stages, instead times each stage of the list command (walking the
+messages, decoding links, decoding addresses, sorting and rendering) on
+synthetic dumps of various numbers of interfaces (see iptool.synth), so no
+netlink socket is used.  Results can be saved as a baseline, and a later run
+fails if any stage has got slower than its baseline by more than the
+threshold (twice running, as timings are noisy).  On machines too noisy for
+that, --warn-only still marks such stages but doesn't fail.  Baselines are
+only meaningful on the machine that made them.
+"""
+
+import io
+import sys
+import json
+import time
+import getopt
+import socket
+import contextlib
+import subprocess
+import tracemalloc
+
+from . import NetlinkSocket, parse_options
+from . import iplist
+from . import parallel
+from . import render
+from . import synth
+from . import decode
+from . import constants
+from .globals import params
+
+
+def measure_records(s):
+    """Decodes a link dump and an address dump and returns (interfaces,
+    addrs_by_interface, bytes per Interface, bytes per Address)."""
+    # Only measure the decoding, not the receive buffer
+    link_bufs = s.transact(constants.RTM_GETLINK, iplist.link_payload())
+    tracemalloc.start()
+    interfaces = iplist.collect_interfaces(s, link_bufs)
+    link_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    addr_bufs = s.transact(constants.RTM_GETADDR, parallel.family_payload(socket.AF_UNSPEC))
+    tracemalloc.start()
+    addrs_by_interface = iplist.collect_addrs(s, addr_bufs, interfaces)
+    addr_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    addr_count = sum(len(l) for l in addrs_by_interface.values())
+    return (interfaces, addrs_by_interface,
+            link_bytes / max(len(interfaces), 1), addr_bytes / max(addr_count, 1))
+
+
+# Milliseconds allowed for importing the list command's modules
+startup_budget = 50.0
+# Modules that must not be loaded unless their command is used
+startup_excluded = ('iptool.monitor', 'iptool.server', 'iptool.parallel', 'iptool.stream',
+                    'iptool.netns', 'iptool.top', 'iptool.counters', 'iptool.route',
+                    'iptool.neigh', 'iptool.addrindex', 'iptool.api', 'iptool.synth',
+                    'iptool.aio', 'iptool.capture', 'iptool.topology', 'iptool.bench', 'json',
+                    'asyncio')
+
+
+def measure_startup(runs = 5):
+    """Returns the best total import time in ms of several runs, plus the
+    set of modules imported."""
+    best = None
+    for n in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                 "import iptool, iptool.iplist, iptool.interface"],
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        total = 0
+        modules = set()
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split("|")
+            if len(fields) != 3 or not fields[0].startswith("import time:") or \
+               not fields[1].strip().isdigit():
+                continue
+            name = fields[2].rstrip()
+            modules.add(name.strip())
+            if name.startswith(" iptool"):
+                # Top-level entries include everything they imported
+                total += int(fields[1])
+        if best is None or total < best:
+            best = total
+    return best / 1000.0, modules
+
+
+def check_startup(budget):
+    ms, modules = measure_startup()
+    print("startup imports: %.1f ms (budget %.1f ms)" % (ms, budget))
+    status = 0
+    for name in startup_excluded:
+        if name in modules:
+            print("  %s should not be imported" % name)
+            status = 1
+    if ms > budget:
+        status = 1
+    return status
+
+
+# Numbers of interfaces to time the stages with
+stage_sizes = (10, 1000, 10000, 100000)
+stage_names = ('walk', 'links', 'addrs', 'sort', 'render')
+# How much slower than the baseline a stage may get, as a percentage; timings
+# of the same code vary by tens of percent from run to run
+regression_threshold = 50.0
+# Stages quicker than this (in seconds) are too noisy to compare
+noise_floor = 0.0005
+# How long to spend repeating each stage, in seconds; the median run counts
+stage_time = 1.0
+min_runs = 5
+max_runs = 50
+
+
+def time_median(fn, setup = None):
+    """Calls fn repeatedly and returns the median time taken and the result
+    of the last call.  The median is steadier than the best time, which one
+    lucky run can set.
+    @param setup  If given, a function called (untimed) before each call of
+                  fn, whose result is passed to fn
+    """
+    times = []
+    spent = 0.0
+    while len(times) < min_runs or spent < stage_time and len(times) < max_runs:
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        spent += elapsed
+        times.append(elapsed)
+    times.sort()
+    return times[len(times) // 2], result
+
+
+def measure_stages(size):
+    """Returns an associative array mapping each stage name to the time
+    (in seconds) it takes with size interfaces."""
+    link_datagrams, addr_datagrams = synth.dump(size)
+    s = synth.SyntheticSocket({ constants.RTM_GETLINK: link_datagrams,
+                                constants.RTM_GETADDR: addr_datagrams })
+    link_bufs = [memoryview(d) for d in link_datagrams]
+    addr_bufs = [memoryview(d) for d in addr_datagrams]
+
+    def walk():
+        count = 0
+        for buf in link_bufs + addr_bufs:
+            for msg in decode.messages(buf):
+                count += 1
+        return count
+
+    def links():
+        s.msg_type = constants.RTM_GETLINK
+        return iplist.collect_interfaces(s, link_bufs)
+
+    def addrs():
+        s.msg_type = constants.RTM_GETADDR
+        return iplist.collect_addrs(s, addr_bufs, interfaces)
+
+    # Records decode their fields when first read and keep them, so sorting
+    # and rendering are given fresh records each time, or only the first
+    # run would do any decoding
+    def sort(interfaces):
+        fields = params['sort']
+        return sorted(interfaces.values(), key=lambda i: i.sort_key(fields))
+
+    def sorted_links():
+        interfaces = links()
+        s.msg_type = constants.RTM_GETADDR
+        return sort(interfaces), iplist.collect_addrs(s, addr_bufs, interfaces)
+
+    def text(records):
+        ordered, addrs_by_interface = records
+        r = render.TextRenderer()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in ordered:
+                r.link(i, addrs_by_interface.get(i.id, []))
+            r.flush()
+
+    times = {}
+    times['walk'], count = time_median(walk)
+    times['links'], interfaces = time_median(links)
+    times['addrs'], result = time_median(addrs)
+    times['sort'], result = time_median(sort, links)
+    times['render'], result = time_median(text, sorted_links)
+    return times
+
+
+def check_stages(sizes, threshold, baseline = None, warn_only = False):
+    """Times the stages at each size, comparing them against baseline (from
+    an earlier run) if given.  Returns the exit status, which is nonzero if
+    any stage has regressed (unless warn_only is True), and the results."""
+    # Use the default options
+    parse_options(["iptool"])
+
+    print("%10s %8s %10s %12s" % ("interfaces", "stage", "ms", "us/interface"))
+    status = 0
+    results = {}
+    for size in sizes:
+        times = measure_stages(size)
+        previous = baseline and baseline.get(str(size)) or {}
+        if any((change(times, previous, stage) or 0) > threshold for stage in stage_names):
+            # One slow timing may just be noise, so only count a stage as
+            # having regressed if a second timing agrees
+            again = measure_stages(size)
+            times = dict((stage, min(times[stage], again[stage])) for stage in stage_names)
+        results[str(size)] = times
+
+        for stage in stage_names:
+            line = "%10d %8s %10.2f %12.3f" % (size, stage, times[stage] * 1e3, times[stage] * 1e6 / size)
+            percent = change(times, previous, stage)
+            if percent is not None:
+                line += "  %+.0f%%" % percent
+                if percent > threshold:
+                    line += "  REGRESSION"
+                    if not warn_only:
+                        status = 1
+            print(line)
+        sys.stdout.flush()
+
+    return status, results
+
+
+def change(times, previous, stage):
+    """Returns how much slower (as a percentage) a stage is than in
+    previous, or None if it can't be compared."""
+    if previous.get(stage, 0) < noise_floor:
+        return None
+    return (times[stage] / previous[stage] - 1) * 100
+
+
+def main(argv):
+    try:
+        optlist, args = getopt.gnu_getopt(argv[1:], '', ['startup', 'budget=', 'stages', 'sizes=',
+                                                         'threshold=', 'baseline=', 'save-baseline=',
+                                                         'warn-only'])
+    except getopt.GetoptError as e:
+        print("%s: Error: %s" % (argv[0], e), file=sys.stderr)
+        return 1
+
+    startup = stages = warn_only = False
+    budget = startup_budget
+    sizes = stage_sizes
+    threshold = regression_threshold
+    baseline_file = save_file = None
+    for option, opt_arg in optlist:
+        if option == "--startup":
+            startup = True
+        elif option == "--budget":
+            budget = float(opt_arg)
+        elif option == "--stages":
+            stages = True
+        elif option == "--sizes":
+            sizes = [int(size) for size in opt_arg.split(',')]
+        elif option == "--threshold":
+            threshold = float(opt_arg)
+        elif option == "--baseline":
+            baseline_file = opt_arg
+        elif option == "--save-baseline":
+            save_file = opt_arg
+        elif option == "--warn-only":
+            warn_only = True
+
+    if startup:
+        return check_startup(budget)
+    elif stages:
+        baseline = None
+        if baseline_file is not None:
+            with open(baseline_file) as f:
+                baseline = json.load(f)
+        status, results = check_stages(sizes, threshold, baseline, warn_only)
+        if save_file is not None:
+            with open(save_file, 'w') as f:
+                json.dump(results, f, indent=2)
+        return status
+
+    s = NetlinkSocket(socket.NETLINK_ROUTE)
+    interfaces, addrs_by_interface, per_link, per_addr = measure_records(s)
+    print("%d interfaces: %.0f bytes per record" % (len(interfaces), per_link))
+    print("%d addresses: %.0f bytes per record" %
+          (sum(len(l) for l in addrs_by_interface.values()), per_addr))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,113 @@
+"""Saves the raw datagrams that iptool receives to a file (--capture), and
+plays them back from the file instead of a socket (--replay), so that odd
+behaviour or slowness on one host can be looked into on another.
+
+The file starts with a magic string, followed by a record for each datagram:
+a header (see record) and then the datagram itself.  Datagrams in reply to
+the same request share a request number, so that consecutive replies to the
+same type of request (e.g. from top) can be told apart.
+"""
+
+import os
+import mmap
+import errno
+import atexit
+import struct
+
+from . import NetlinkSocket, ReceiveBuffer
+from . import decode
+from . import constants
+
+
+magic = b"iptool capture\n\0"
+# Datagram length, request number, request type, (padding)
+record = struct.Struct("=IIHxx")
+
+
+class Capture(object):
+    """A capture file being written, which may be shared between sockets."""
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.f.write(magic)
+        self.requests = 0
+        atexit.register(self.close)
+
+
+    def new_request(self):
+        """Returns the number to give datagrams in reply to a new request."""
+        self.requests += 1
+        return self.requests
+
+
+    def write(self, request, msg_type, datagram):
+        self.f.write(record.pack(len(datagram), request, msg_type))
+        self.f.write(datagram)
+
+
+    def close(self):
+        self.f.close()
+
+
+
+class ReplaySocket(NetlinkSocket):
+    """A NetlinkSocket that answers each request with the datagrams that a
+    capture file recorded for the next request of the same type.  The file
+    is mapped into memory, and each datagram is handed out as a read-only
+    view of the mapping, so nothing is copied."""
+
+    def __init__(self, path):
+        """Raises OSError if path can't be read or isn't a capture file."""
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                raise OSError(errno.EINVAL, "Not a capture file", path)
+        view = memoryview(self.map)
+        if view[:len(magic)] != magic:
+            raise OSError(errno.EINVAL, "Not a capture file", path)
+
+        # Group the datagrams by request, in the order the requests were made
+        self.replies = []   # a list of [type, datagram list] pairs
+        by_request = {}
+        offset = len(magic)
+        while offset + record.size <= len(view):
+            length, request, msg_type = record.unpack_from(view, offset)
+            offset += record.size
+            if request not in by_request:
+                by_request[request] = [msg_type, []]
+                self.replies.append(by_request[request])
+            by_request[request][1].append(view[offset:offset + length])
+            offset += length
+
+        self.sock = None
+        self.rbuf = ReceiveBuffer(0)    # not used, as nothing is received
+        self.seq = 0
+        self.pid = os.getpid()
+        self.msg_type = 0
+        self.request = 0
+        self.pending = iter(())
+
+
+    def set_strict_check(self, enable):
+        return False
+
+
+    def send_msg(self, msg_type, payload, flags = constants.NLM_F_DUMP):
+        self.msg_type = msg_type
+        for n, (reply_type, datagrams) in enumerate(self.replies):
+            if reply_type == msg_type:
+                del self.replies[n]
+                self.pending = iter(datagrams)
+                # Expect the sequence number of the request that was captured
+                self.seq = decode.nlmsghdr.unpack_from(datagrams[0])[3]
+                return
+        raise OSError(errno.ENODATA, "No more replies of type %d in the capture file" % msg_type)
+
+
+    def recv_msg(self):
+        try:
+            return next(self.pending)
+        except StopIteration:
+            raise OSError(errno.ENODATA, "Reply cut short in the capture file")
@@ -0,0 +1,150 @@
+# Values from the Linux UAPI headers, for those that iptool uses.  Keeping
+# them here rather than importing them means that startup doesn't have to
+# load several large header modules.
+
+# linux/netlink.h
+NLM_F_REQUEST	= 0x01
+NLM_F_MULTI	= 0x02
+NLM_F_ACK	= 0x04
+NLM_F_ECHO	= 0x08
+NLM_F_DUMP_INTR	= 0x10
+NLM_F_DUMP_FILTERED	= 0x20
+NLM_F_ROOT	= 0x100
+NLM_F_MATCH	= 0x200
+NLM_F_DUMP	= NLM_F_ROOT | NLM_F_MATCH
+NLM_F_CAPPED	= 0x100
+NLM_F_ACK_TLVS	= 0x200
+
+NLMSG_NOOP	= 1
+NLMSG_ERROR	= 2
+NLMSG_DONE	= 3
+NLMSG_OVERRUN	= 4
+
+SOL_NETLINK	= 270	# linux/socket.h
+NETLINK_EXT_ACK	= 11
+NETLINK_GET_STRICT_CHK	= 12
+
+NLMSGERR_ATTR_MSG	= 1
+NLMSGERR_ATTR_OFFS	= 2
+
+SO_RCVBUFFORCE	= 33	# asm-generic/socket.h
+
+# linux/rtnetlink.h
+RTM_BASE	= 16
+RTM_NEWLINK	= 16
+RTM_DELLINK	= 17
+RTM_GETLINK	= 18
+RTM_NEWADDR	= 20
+RTM_DELADDR	= 21
+RTM_GETADDR	= 22
+RTM_NEWROUTE	= 24
+RTM_DELROUTE	= 25
+RTM_GETROUTE	= 26
+RTM_NEWNEIGH	= 28
+RTM_DELNEIGH	= 29
+RTM_GETNEIGH	= 30
+
+def RTM_FAM(cmd):
+    return (cmd - RTM_BASE) >> 2
+
+RTEXT_FILTER_VF	= 0x1
+RTEXT_FILTER_BRVLAN	= 0x2
+RTEXT_FILTER_BRVLAN_COMPRESSED	= 0x4
+RTEXT_FILTER_SKIP_STATS	= 0x8
+
+RTMGRP_LINK	= 0x01
+RTMGRP_IPV4_IFADDR	= 0x10
+RTMGRP_IPV6_IFADDR	= 0x100
+
+RTN_UNSPEC	= 0
+RTN_UNICAST	= 1
+RTN_LOCAL	= 2
+RTN_BROADCAST	= 3
+RTN_ANYCAST	= 4
+RTN_MULTICAST	= 5
+RTN_BLACKHOLE	= 6
+RTN_UNREACHABLE	= 7
+RTN_PROHIBIT	= 8
+RTN_THROW	= 9
+
+RT_TABLE_DEFAULT	= 253
+RT_TABLE_MAIN	= 254
+RT_TABLE_LOCAL	= 255
+
+RTA_DST	= 1
+RTA_SRC	= 2
+RTA_IIF	= 3
+RTA_OIF	= 4
+RTA_GATEWAY	= 5
+RTA_PRIORITY	= 6
+RTA_PREFSRC	= 7
+RTA_MULTIPATH	= 9
+RTA_TABLE	= 15
+
+RT_SCOPE_UNIVERSE	= 0
+RT_SCOPE_SITE	= 200
+RT_SCOPE_LINK	= 253
+RT_SCOPE_HOST	= 254
+RT_SCOPE_NOWHERE	= 255
+
+# linux/neighbour.h
+NDA_DST	= 1
+NDA_LLADDR	= 2
+NDA_IFINDEX	= 8
+
+NTF_ROUTER	= 0x80
+
+NUD_INCOMPLETE	= 0x01
+NUD_REACHABLE	= 0x02
+NUD_STALE	= 0x04
+NUD_DELAY	= 0x08
+NUD_PROBE	= 0x10
+NUD_FAILED	= 0x20
+NUD_NOARP	= 0x40
+NUD_PERMANENT	= 0x80
+NUD_NONE	= 0x00
+
+# linux/if.h
+IFF_UP	= 0x1
+IFF_LOOPBACK	= 0x8
+IFF_POINTOPOINT	= 0x10
+IFF_LOWER_UP	= 0x10000
+
+IF_OPER_UNKNOWN	= 0
+IF_OPER_NOTPRESENT	= 1
+IF_OPER_DOWN	= 2
+IF_OPER_LOWERLAYERDOWN	= 3
+IF_OPER_TESTING	= 4
+IF_OPER_DORMANT	= 5
+IF_OPER_UP	= 6
+
+# linux/if_link.h
+IFLA_UNSPEC	= 0
+IFLA_ADDRESS	= 1
+IFLA_BROADCAST	= 2
+IFLA_IFNAME	= 3
+IFLA_MTU	= 4
+IFLA_LINK	= 5
+IFLA_MASTER	= 10
+IFLA_OPERSTATE	= 16
+IFLA_LINKINFO	= 18
+IFLA_STATS64	= 23
+IFLA_EXT_MASK	= 29
+IFLA_LINK_NETNSID	= 37
+
+IFLA_INFO_KIND	= 1
+IFLA_INFO_DATA	= 2
+
+IFLA_VLAN_ID	= 1
+IFLA_VLAN_FLAGS	= 2
+
+# linux/if_addr.h
+IFA_UNSPEC	= 0
+IFA_ADDRESS	= 1
+IFA_LOCAL	= 2
+IFA_LABEL	= 3
+IFA_BROADCAST	= 4
+IFA_ANYCAST	= 5
+IFA_CACHEINFO	= 6
+IFA_MULTICAST	= 7
+IFA_FLAGS	= 8
@@ -0,0 +1,93 @@
+"""Keeps the IFLA_STATS64 counters of every interface in a table with an array
+per counter (i.e. a column) rather than an object per interface, so that
+rates can be worked out a column at a time, mostly in C.
+
+Rows are in the order the kernel dumped the interfaces; rows maps an ifindex
+to its row number.
+"""
+
+import array
+import operator
+
+from . import decode
+from . import constants
+
+
+# Columns in the order they appear in struct rtnl_link_stats64
+columns = ('rx_packets', 'tx_packets', 'rx_bytes', 'tx_bytes',
+           'rx_errors', 'tx_errors', 'rx_dropped', 'tx_dropped')
+
+
+class CounterTable(object):
+    def __init__(self):
+        self.ids = array.array('i')
+        self.names = []
+        self.rows = {}
+        self.columns = dict((c, array.array('Q')) for c in columns)
+
+
+    def load(self, s, bufs):
+        """Fills the table from the datagrams of an RTM_GETLINK dump."""
+        # Gather the counters row by row as raw bytes, then convert them in
+        # one go and split them into columns by slicing with a stride
+        raw = bytearray()
+        for buf in bufs:
+            s.process_messages(buf, add_link, self, raw)
+
+        values = array.array('Q')
+        values.frombytes(raw)
+        for n, c in enumerate(columns):
+            self.columns[c] = values[n::len(columns)]
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+
+def add_link(s, chunk, table, raw):
+    index = decode.ifinfomsg.unpack_from(chunk)[2]
+    name = stats = None
+    for rta_type, data in decode.attrs(chunk, decode.IFINFOMSG_LEN):
+        if rta_type == constants.IFLA_IFNAME:
+            name = decode.string(data)
+        elif rta_type == constants.IFLA_STATS64:
+            stats = data
+        if name is not None and stats is not None:
+            break
+
+    table.rows[index] = len(table.ids)
+    table.ids.append(index)
+    table.names.append(name)
+    if stats is not None and len(stats) >= decode.rtnl_link_stats64.size:
+        raw += stats[:decode.rtnl_link_stats64.size]
+    else:
+        raw += bytes(decode.rtnl_link_stats64.size)
+
+
+def rates(old, new, interval):
+    """Works out how fast each counter went up between two tables.
+    @param interval  The time between the tables, in seconds
+    @return          An associative array mapping each column name to a list
+                     of per-second rates, one for each row of new
+    """
+    if old.ids == new.ids:
+        # The usual case: nothing has been added or removed
+        previous = old.columns
+    else:
+        # Line the old rows up with the new ones; new interfaces start at 0
+        order = [old.rows.get(index) for index in new.ids]
+        previous = {}
+        for c in columns:
+            old_column = old.columns[c]
+            previous[c] = [old_column[row] if row is not None else value
+                           for row, value in zip(order, new.columns[c])]
+
+    result = {}
+    for c in columns:
+        # Counters go backwards if an interface is replaced by one with the
+        # same index
+        result[c] = [d / interval if d > 0 else 0.0
+                     for d in map(operator.sub, new.columns[c], previous[c])]
+
+    return result
@@ -0,0 +1,148 @@
+"""Walks netlink messages and rtattr chains using precompiled structs.
+
+Everything here works on anything supporting the buffer protocol (typically a
+memoryview of a receive buffer) and hands out sub-views rather than copies.
+"""
+
+import struct
+
+from . import constants
+
+
+# struct nlmsghdr: length, type, flags, sequence number, port ID
+nlmsghdr = struct.Struct("=IHHII")
+# struct rtgenmsg: family
+rtgenmsg = struct.Struct("=B")
+# struct ifinfomsg: family, (padding), type, index, flags, change mask
+ifinfomsg = struct.Struct("=BxHiII")
+# struct ifaddrmsg: family, prefix length, flags, scope, index
+ifaddrmsg = struct.Struct("=BBBBI")
+# struct rtmsg: family, dst_len, src_len, tos, table, protocol, scope, type, flags
+rtmsg = struct.Struct("=BBBBBBBBI")
+# struct rtnexthop: length, flags, hops, ifindex
+rtnexthop = struct.Struct("=HBBi")
+# struct ndmsg: family, (padding), interface index, state, flags, type
+ndmsg = struct.Struct("=BxxxiHBB")
+# struct rtattr: length, type
+rtattr = struct.Struct("=HH")
+# struct rtnl_link_stats64: rx/tx packets, rx/tx bytes, rx/tx errors, rx/tx
+# dropped (only the leading fields; the kernel keeps adding more)
+rtnl_link_stats64 = struct.Struct("=8Q")
+
+u8  = struct.Struct("=B")
+u16 = struct.Struct("=H")
+u32 = struct.Struct("=I")
+s32 = struct.Struct("=i")
+u64 = struct.Struct("=Q")
+
+NLMSG_HDRLEN = nlmsghdr.size
+RTA_HDRLEN = rtattr.size
+IFINFOMSG_LEN = ifinfomsg.size
+IFADDRMSG_LEN = ifaddrmsg.size
+RTMSG_LEN = rtmsg.size
+NDMSG_LEN = ndmsg.size
+
+# The top two bits of rta_type are flags (NLA_F_NESTED, NLA_F_NET_BYTEORDER)
+RTA_TYPE_MASK = 0x3FFF
+
+
+def align(length):
+    """Rounds up to the 4-byte boundary used by both NLMSG_ALIGN and RTA_ALIGN."""
+    return (length + 3) & ~3
+
+
+def messages(view):
+    """Generates a (type, flags, seq, payload) tuple for each message in a
+    datagram, where payload is a view of the data after the Nlmsghdr."""
+    unpack = nlmsghdr.unpack_from
+    offset = 0
+    end = len(view)
+    while offset + NLMSG_HDRLEN <= end:
+        length, msg_type, flags, seq, pid = unpack(view, offset)
+        if length < NLMSG_HDRLEN:
+            # Malformed; there's no way to find the next message
+            break
+        yield msg_type, flags, seq, view[offset + NLMSG_HDRLEN:offset + length]
+        offset += align(length)
+
+
+def attrs(view, offset = 0):
+    """Generates a (type, data) tuple for each rtattr in a chain starting at
+    offset, where data is a view of the attribute's payload."""
+    unpack = rtattr.unpack_from
+    end = len(view)
+    while offset + RTA_HDRLEN <= end:
+        length, rta_type = unpack(view, offset)
+        if length < RTA_HDRLEN:
+            break
+        yield rta_type & RTA_TYPE_MASK, view[offset + RTA_HDRLEN:offset + length]
+        offset += align(length)
+
+
+def compact_attrs(view, offset, wanted, unknown = None):
+    """Makes one pass over an rtattr chain starting at offset, and returns a
+    copy of the message with only the rtattrs whose types are in wanted
+    (i.e. the header struct followed by those), along with an associative
+    array mapping each of those types to the offset of its rtattr in the
+    copy.  unknown, if given, is called with each type not in wanted."""
+    unpack = rtattr.unpack_from
+    end = len(view)
+    pieces = [view[:offset]]
+    offsets = {}
+    size = offset
+    while offset + RTA_HDRLEN <= end:
+        length, rta_type = unpack(view, offset)
+        if length < RTA_HDRLEN:
+            break
+        rta_type &= RTA_TYPE_MASK
+        aligned = align(length)
+        if rta_type in wanted:
+            pieces.append(view[offset:offset + aligned])
+            offsets[rta_type] = size
+            size += aligned
+        elif unknown is not None:
+            unknown(rta_type)
+        offset += aligned
+    return b"".join(pieces), offsets
+
+
+def attr_at(view, offset):
+    """Returns a view of the payload of the rtattr at offset."""
+    length, rta_type = rtattr.unpack_from(view, offset)
+    return memoryview(view)[offset + RTA_HDRLEN:offset + length]
+
+
+def error(chunk, msg_flags, done = False):
+    """Decodes the payload of an NLMSG_ERROR message (or with done True, an
+    NLMSG_DONE) and returns an (errno, message) tuple, where errno is
+    positive (or 0 for an ACK) and message is the extended ACK text, or None
+    if the kernel didn't supply any."""
+    if len(chunk) < s32.size:
+        return 0, None
+    error = -s32.unpack_from(chunk)[0]
+    if not msg_flags & constants.NLM_F_ACK_TLVS:
+        return error, None
+
+    if done:
+        offset = s32.size
+    elif msg_flags & constants.NLM_F_CAPPED:
+        # The request's Nlmsghdr follows, without its payload
+        offset = s32.size + NLMSG_HDRLEN
+    else:
+        offset = s32.size + align(nlmsghdr.unpack_from(chunk, s32.size)[0])
+    for rta_type, data in attrs(chunk, offset):
+        if rta_type == constants.NLMSGERR_ATTR_MSG:
+            return error, string(data)
+    return error, None
+
+
+def string(data):
+    """Decodes a NUL-terminated string attribute."""
+    return bytes(data).split(b'\0', 1)[0].decode('ascii')
+
+
+def pack_attr(rta_type, data):
+    """Builds an rtattr structure (padded to the alignment boundary) for use in
+    a request."""
+    length = RTA_HDRLEN + len(data)
+    return (rtattr.pack(length, rta_type) + data).ljust(align(length), b'\0')
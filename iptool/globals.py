@@ -1,4 +1,29 @@
 from collections import defaultdict
 
-# Create a special dict object that defaults to False for unspecified options
-params = defaultdict(bool)
+
+class Options(defaultdict):
+    """Options that change what's shown and how, keyed by the names used for
+    params, e.g. 'sort' (a list of field names), 'no-grouping', 'verbose' and
+    'format'.  Options that haven't been set are False.  Keyword arguments
+    set options, with underscores standing for hyphens, e.g.
+    Options(no_grouping=True, format='json')."""
+
+    def __init__(self, **options):
+        defaultdict.__init__(self, bool)
+        self.reset()
+        for name, value in options.items():
+            self[name.replace('_', '-')] = value
+
+
+    def reset(self):
+        """Sets every option back to its default."""
+        self.clear()
+        self['debug'] = 0
+        self['blank-lines'] = True
+        self['verbose'] = 0
+        self['socket'] = None
+        self['sort'] = ['name']
+
+
+# The options given on the command line
+params = Options()
@@ -1,178 +1,174 @@
-import socket
-import ctypes
-import functools
+from . import util
+from . import record
+from . import decode
+from . import constants
 
-import cpylmnl.linux.netlinkh as netlink
-import cpylmnl.linux.rtnetlinkh as rtnl
-import cpylmnl.linux.ifh
-import cpylmnl.linux.if_linkh as if_link
-import cpylmnl.linux.if_addrh as if_addr
 
-from . import util
-from .globals import params
+# Functions that return the value to sort by for each field name
+sort_fields = { 'name':  lambda i: i.name,
+                'id':    lambda i: i.id,
+                'state': lambda i: util.state_ranks[i.get_state()],
+                'mtu':   lambda i: i.mtu or 0,
+                'type':  lambda i: i.link_type }
+
+
+# Functions that decode each lazily-decoded field (see record.Record)
+def decode_name(i):
+    data = i.attr(constants.IFLA_IFNAME)
+    return decode.string(data) if data is not None else None
+
+
+def decode_link_type(i):
+    link_type = util.decode_link_type(i.ifi_type())
+    # Use better information if we have it
+    if link_type == "other":
+        return i.link_kind() or link_type
+    return link_type
+
+
+def decode_state(i):
+    # See https://www.kernel.org/doc/Documentation/networking/operstates.txt
+    data = i.attr(constants.IFLA_OPERSTATE)
+    return data[0] if data is not None else constants.IF_OPER_UNKNOWN
+
+
+def decode_mtu(i):
+    data = i.attr(constants.IFLA_MTU)
+    return decode.u32.unpack_from(data)[0] if data is not None else None
+
+
+def decode_hwaddr(i):
+    # This also handles longer MAC addrs
+    data = i.attr(constants.IFLA_ADDRESS)
+    return util.decode_mac_addr(data) if data is not None else None
+
+
+def decode_parent_link(i):
+    # Only for VLANs, etc.; this is the ID of the real interface
+    data = i.attr(constants.IFLA_LINK)
+    return decode.s32.unpack_from(data)[0] if data is not None else None
+
+
+def decode_master(i):
+    # The ID of the bridge or bond that the interface is a port of
+    data = i.attr(constants.IFLA_MASTER)
+    return decode.u32.unpack_from(data)[0] if data is not None else None
+
+
+def decode_link_info(i):
+    data = i.attr(constants.IFLA_LINKINFO)
+    if data is None:
+        return None
+    link_info = util.process_rta_chain(data, util.link_info_rtattr_map, i)
+    # The kind is the link_type instead (see decode_link_type())
+    if 'kind' in link_info and util.decode_link_type(i.ifi_type()) == "other":
+        del link_info['kind']
+    return link_info
+
 
+# The decoded fields that same_as() compares, and where the ifinfomsg's
+# change mask starts
+compared_fields = ('name', 'link_type', 'state', 'mtu', 'hwaddr', 'parent_link', 'master',
+                   'link_info')
+change_offset = decode.IFINFOMSG_LEN - 4
 
-class Interface(object):
-    def __lt__(a, b):
+
+
+class Interface(record.Record):
+    # Attributes that weren't supplied by the kernel are None, apart from
+    # state which defaults to IF_OPER_UNKNOWN.  netns is the label of the
+    # network namespace the interface was found in, if not the current one.
+    # Only id, flags and netns are set up front; the rest are decoded from
+    # the message when first read.
+    __slots__ = ('id', 'name', 'link_type', 'flags', 'state', 'mtu', 'hwaddr',
+                 'parent_link', 'master', 'link_info', 'netns')
+
+    decoders = { 'name':	decode_name,
+                 'link_type':	decode_link_type,
+                 'state':	decode_state,
+                 'mtu':	decode_mtu,
+                 'hwaddr':	decode_hwaddr,
+                 'parent_link':	decode_parent_link,
+                 'master':	decode_master,
+                 'link_info':	decode_link_info }
+    attr_types = frozenset((constants.IFLA_IFNAME, constants.IFLA_LINK, constants.IFLA_ADDRESS,
+                            constants.IFLA_MASTER, constants.IFLA_OPERSTATE, constants.IFLA_MTU,
+                            constants.IFLA_LINKINFO, constants.IFLA_LINK_NETNSID))
+    kind = "link"
+    # IFLA_GROUP
+
+    def sort_key(self, fields, grouping = True):
         """
-        Allows sorting of interfaces by name.  Forces the loopback interface to
-        be first in the sequence.
+        Returns a tuple that can be used to sort interfaces by the named
+        fields (see sort_fields).  Unless grouping is False, the loopback
+        interface is forced to be first in the sequence and tunnels last.
         """
 
-        ## if a.info['name'] == "lo":
-        if not params['no-grouping'] and \
-           a.info['flags'] & cpylmnl.linux.ifh.IFF_LOOPBACK != \
-           b.info['flags'] & cpylmnl.linux.ifh.IFF_LOOPBACK:
-            # The maths works on the bit in each flags word
-            return (a.info['flags'] & cpylmnl.linux.ifh.IFF_LOOPBACK) > 0
-        elif not params['no-grouping'] and \
-             a.is_tun() != b.is_tun():
-            return b.is_tun()   # Tunnel interfaces come later
-        elif params['state-sort'] and a.get_state() != b.get_state():
-            return b.get_state() < a.get_state()
-        elif params['id-sort']:
-            return a.info['id'] < b.info['id']
+        if grouping:
+            if self.flags & constants.IFF_LOOPBACK:
+                group = 0
+            elif self.is_tun():
+                group = 2   # Tunnel interfaces come later
+            else:
+                group = 1
+            return (group,) + tuple(sort_fields[f](self) for f in fields)
         else:
-            return a.info['name'] < b.info['name']
+            return tuple(sort_fields[f](self) for f in fields)
 
 
-    ## @classmethod
-    ## def get_sort_key_fn(cls):
-    ##     return functools.cmp_to_key(cls.cmp)
+    def same_as(self, other):
+        """
+        Returns whether other (an Interface or None) shows the interface the
+        same way, i.e. whether nothing worth showing has changed.  The
+        messages are compared first, so fields are only decoded if they
+        differ (e.g. in bridge timers, which link_info doesn't show).
+        """
+
+        if other is None or self.id != other.id or self.flags != other.flags or \
+           self.netns != other.netns:
+            return False
+        # Skip the change mask, which differs between dumps and notifications
+        if self.raw[:change_offset] == other.raw[:change_offset] and \
+           self.raw[decode.IFINFOMSG_LEN:] == other.raw[decode.IFINFOMSG_LEN:]:
+            return True
+        return all(getattr(self, f) == getattr(other, f) for f in compared_fields)
 
 
-    # Warning: don't store ifinfomsg header or data because the buffer it's in
-    # could be garbage collected
     def __init__(self, s, chunk):
-        ## print("sub-buffer length:", len(chunk.contents))
-        ifinfomsg = rtnl.Ifinfomsg.from_pointer(chunk)
-        ## print(binascii.hexlify(ctypes.cast(chunk, ctypes.POINTER(ctypes.c_char))[0:16]))
-        ## print("%d (%d)" % (ifinfomsg.ifi_index, ifinfomsg.ifi_type))
-
-        # Find the first Rtattr
-        offset = netlink.NLMSG_ALIGN(ctypes.sizeof(ifinfomsg))
-        bytes_remaining = len(chunk.contents) - offset
-        ## print(bytes_remaining, "...")
-        ## attr = rtnl.Rtattr.from_address(ctypes.addressof(chunk.contents) + offset)
-        attr = if_link.IFLA_RTA(chunk.contents)
-
-        # Process attributes to find name, hardware address, etc.
-        self.info = {'link_type': util.decode_link_type(ifinfomsg.ifi_type),
-                     'id': ifinfomsg.ifi_index,
-                     'flags': ifinfomsg.ifi_flags, 'state': cpylmnl.linux.ifh.IF_OPER_UNKNOWN }
-        unprocessed = []
-        while bytes_remaining > 0:
-            data_ptr = rtnl.RTA_DATA(attr)
-            ## print("type:", attr.rta_type)
-            if attr.rta_type == if_link.IFLA_IFNAME:
-                self.info['name'] = ctypes.cast(data_ptr, ctypes.c_char_p).value.decode('ascii')
-            elif attr.rta_type == if_link.IFLA_LINK:
-                # Only for VLANs, etc.; this is the ID of the real interface
-                self.info['parent_link'] = (ctypes.cast(data_ptr, ctypes.POINTER(ctypes.c_int))).contents.value
-            elif attr.rta_type == if_link.IFLA_ADDRESS:
-                # This should also handle longer MAC addrs
-                addr_len = rtnl.RTA_PAYLOAD(attr)
-                mac_bytes = ctypes.cast(data_ptr, ctypes.POINTER((ctypes.c_ubyte * addr_len))).contents
-                self.info['hwaddr'] = util.decode_mac_addr(mac_bytes)
-            elif attr.rta_type == if_link.IFLA_OPERSTATE:
-                # See https://www.kernel.org/doc/Documentation/networking/operstates.txt
-                self.info['state' ] = (ctypes.cast(data_ptr, ctypes.POINTER(ctypes.c_ubyte))).contents.value
-            elif attr.rta_type == if_link.IFLA_MTU:
-                self.info['mtu' ] = (ctypes.cast(data_ptr, ctypes.POINTER(ctypes.c_uint))).contents.value
-            elif attr.rta_type == if_link.IFLA_LINKINFO:
-                ## self.info['details'] = rtnl.RTA_PAYLOAD(attr)
-                self.info['link_info'] = s.process_rta_chain(data_ptr, util.link_info_rtattr_map, self)
-            else:
-                unprocessed.append(attr.rta_type)
-            # IFLA_GROUP
-
-            # Post-process the link_type if we have better information
-            if self.info['link_type'] == "other" and \
-               'link_info' in self.info and 'kind' in self.info['link_info']:
-                self.info['link_type'] = self.info['link_info']['kind']
-                del self.info['link_info']['kind']
-
-            # advance to the next Rtattr
-            attr, bytes_remaining = rtnl.RTA_NEXT(attr, bytes_remaining)
-
-        ## print("   ", unprocessed)
-
-
-    def show_link_info(self, addrs):
-        t = self.info['link_type']
-        extra_info = [self.get_state()]
-        extra_info.append("ID: %d" % self.info['id'])
-        if 'hwaddr' in self.info and t != 'loopback':
-            extra_info.append("MAC addr: " + self.info['hwaddr'])
-        if 'details' in self.info:
-            extra_info.append("%d bytes of link info" % self.info['details'])
-        if 'link_info' in self.info:
-            if 'kind' in self.info['link_info']:
-                # treat it as a subtype if the actual link type wasn't "other"
-                ## extra_info.append("sub-type: " + self.info['link_info']['kind'])
-                t = "%s (%s)" % (t, self.info['link_info']['kind'])
-            if 'data' in self.info['link_info']:
-                if 'vlan_id' in self.info['link_info']['data']:
-                    extra_info.append("VLAN ID: %d" % self.info['link_info']['data']['vlan_id'])
-                if 'vlan_flags' in self.info['link_info']['data']:
-                    extra_info.append("VLAN flags: %04x" % self.info['link_info']['data']['vlan_flags'])
-                if 'unknown' in self.info['link_info']['data']:
-                    extra_info.append(self.info['link_info']['data']['unknown'])
-
-        if 'parent_link' in self.info:
-            print("%s [%d] (%s; %s):" % (self.info['name'], self.info['parent_link'],
-                                         t, "; ".join(extra_info)))
-        else:
-            print("%s (%s; %s):" % (self.info['name'], t, "; ".join(extra_info)))
+        ## print("sub-buffer length:", len(chunk))
+        family, ifi_type, index, flags, change = decode.ifinfomsg.unpack_from(chunk)
+        ## print("%d (%d)" % (index, ifi_type))
+        self.id = index
+        self.flags = flags
+        self.netns = None
+        self.index_attrs(chunk, decode.IFINFOMSG_LEN)
 
-        self.show_addrs(self.info['id'], addrs, params['verbose'] >= 2)
 
+    def ifi_type(self):
+        return decode.ifinfomsg.unpack_from(self.raw)[1]
 
-    def get_state(self):
-        return util.decode_link_state(self.info['state'], self.info['flags'])
 
+    def link_kind(self):
+        """Returns the IFLA_INFO_KIND (e.g. "vlan"), or None, without decoding
+        the rest of link_info."""
+        data = self.attr(constants.IFLA_LINKINFO)
+        if data is not None:
+            for rta_type, info_data in decode.attrs(data):
+                if rta_type == constants.IFLA_INFO_KIND:
+                    return decode.string(info_data)
+        return None
 
-    def is_tun(self):
-        return self.info['link_type'] == "tun" or \
-                'link_info' in self.info and 'kind' in self.info['link_info'] and self.info['link_info']['kind'] == "tun"
 
+    def parent_is_local(self):
+        """Whether parent_link is the ID of an interface in the same network
+        namespace, rather than in the one given by IFLA_LINK_NETNSID (e.g.
+        for the peer of a veth that was moved)."""
+        return self.attr(constants.IFLA_LINK_NETNSID) is None
 
-    def show_addrs(self, i, addrs, include_link_local = True):
-        if i in addrs:
-            ## TO-DO: sort
-            if_addrs = [addr for addr in addrs[i] if addr['scope'] != rtnl.RT_SCOPE_LINK or include_link_local]
-        else:
-            if_addrs = []
 
-        if if_addrs:
-            for addr in if_addrs:
-                self.show_addr_info(addr)
-        else:
-            print("    no addresses")
-
-
-    def show_addr_info(self, addr_info):
-        extra_info = [util.decode_scope(addr_info['scope'])]
-        if extra_info == ['global']:
-            extra_info = []
-        ## if self.info['flags'] & cpylmnl.linux.ifh.IFF_POINTOPOINT:
-        if 'remote_addr' in addr_info:
-            extra_info.append("remote: %s" % addr_info['remote_addr'])
-        # Only show the flags if they're not just IFA_F_PERMANENT
-        ## addr_info['flags']
-        if 'name' in addr_info and addr_info['name'] != self.info['name']:
-            print(util.add_extra("    %s: %s/%d" % (addr_info['name'], addr_info['addr'], addr_info['prefix']),
-                                 extra_info))
-        else:
-            ## print addr_info
-            if 'addr' in addr_info:
-                print(util.add_extra("    %s/%d" % (addr_info['addr'], addr_info['prefix']),
-                                     extra_info))
-            else:
-                print(util.add_extra("    no local address",
-                                     extra_info))
-            ## print "    %s/%d (%d [%04x])" % (addr_info['addr'], addr_info['prefix'], addr_info['scope'], addr_info['flags'])
+    def get_state(self):
+        return util.decode_link_state(self.state, self.flags)
 
 
-    def __getattr__(self, a):
-        return self.info[a]
+    def is_tun(self):
+        return self.link_type == "tun" or self.link_kind() == "tun"
@@ -1,125 +1,152 @@
-import sys
 import socket
-import ctypes
-import binascii
-
-import cpylmnl.linux.netlinkh as netlink
-import cpylmnl.linux.rtnetlinkh as rtnl
-import cpylmnl.linux.if_linkh as if_link
-import cpylmnl.linux.if_addrh as if_addr
-import cpylmnl.linux.ifh
+import errno
 
 from .interface import Interface
-from . import util
+from .address import Address
+from . import render
+from . import decode
+from . import constants
+from . import timing
 from .globals import params
 
 
-def pointer_add(p, i):
-    """Takes any pointer and returns a void pointer with an amount in bytes
-    (may be negative) added"""
-    return ctypes.c_void_p(ctypes.cast(p, ctypes.c_void_p).value + i)
+def link_payload(index = 0):
+    """Returns the payload of an RTM_GETLINK request: an ifinfomsg followed
+    by IFLA_EXT_MASK.  The mask has RTEXT_FILTER_SKIP_STATS set, which makes
+    the kernel leave the per-device IPv6 counters (IFLA_INET6_STATS and
+    IFLA_INET6_ICMP6STATS) out of IFLA_AF_SPEC, roughly halving it; nothing
+    here uses them.  It doesn't affect IFLA_STATS or IFLA_STATS64, which
+    are always sent.  VF info and bridge VLANs are left out too, as their
+    flags aren't set."""
+    return decode.ifinfomsg.pack(socket.AF_UNSPEC, 0, index, 0, 0) + \
+           decode.pack_attr(constants.IFLA_EXT_MASK,
+                            decode.u32.pack(constants.RTEXT_FILTER_SKIP_STATS))
 
 
 def get_interfaces(s):
-    payload = rtnl.Rtgenmsg()
-    payload.rtgen_family = socket.AF_UNSPEC    # socket.AF_INET
+    return collect_interfaces(s, s.transact(constants.RTM_GETLINK, link_payload()))
+
 
+def collect_interfaces(s, bufs):
+    """Returns an associative array (indexed by interface ID) of Interface
+    objects from a list of datagrams received in reply to RTM_GETLINK."""
     return_values = {}
-    for buf in s.transact(rtnl.RTM_GETLINK, payload):
+    for buf in bufs:
         for i in s.process_messages(buf, get_link_info):
             return_values[i.id] = i
 
     return return_values
 
 
-def show_links(interfaces, addrs_by_interface):
-    count = 0
-    for i in sorted(interfaces.values()):
-        count += 1
-        if params['blank-lines'] and count > 1:
-            print()
-        i.show_link_info(addrs_by_interface)
-
-
-# @param message    A pointer to an array of the size of the sub-buffer
+def get_interface(s, name = None, index = None):
+    """Asks the kernel for a single interface, by name or ID, and returns an
+    associative array like get_interfaces() does.  Raises OSError (e.g.
+    ENODEV) if there's no such interface, or (EPROTO) if the reply isn't
+    about exactly one interface, e.g. when replaying a capture of another
+    command."""
+    payload = link_payload(index or 0)
+    if name is not None:
+        payload += decode.pack_attr(constants.IFLA_IFNAME, name.encode('ascii') + b'\0')
+
+    interfaces = collect_interfaces(s, s.transact(constants.RTM_GETLINK, payload, 0))
+    if len(interfaces) != 1:
+        raise OSError(errno.EPROTO, "Reply doesn't match the request (capture of another command?)")
+    return interfaces
+
+
+def sort_links(interfaces, options = None):
+    """Returns the Interface objects in the order given by options (a
+    globals.Options, by default params)."""
+    if options is None:
+        options = params
+    fields = options['sort']
+    grouping = not options['no-grouping']
+    return sorted(interfaces.values(), key=lambda i: i.sort_key(fields, grouping))
+
+
+# @param r  A renderer to add the links to, which the caller must flush;
+#           by default a new one is made and flushed
+def show_links(interfaces, addrs_by_interface, r = None):
+    if r is None:
+        r = show_links(interfaces, addrs_by_interface, render.make_renderer())
+        with timing.phase("output"):
+            r.flush()
+        return
+    with timing.phase("sort"):
+        ordered = sort_links(interfaces, r.options)
+    with timing.phase("render"):
+        for i in ordered:
+            r.link(i, addrs_by_interface.get(i.id, []))
+    return r
+
+
+def stream_links(pairs):
+    """Shows each (Interface, Address list) pair as soon as it's
+    generated, in whatever order that happens to be.  JSON output is a
+    single document, so that is written at the end instead."""
+    r = render.make_renderer()
+    for i, addrs in pairs:
+        r.link(i, addrs)
+        # Don't let output sit in a buffer while waiting for the kernel
+        if r.incremental:
+            r.flush()
+    r.flush()
+
+
+# @param chunk      A view of the sub-buffer
 # @param family     Which INET family to use, or None for all
 def get_link_info(s, chunk):
     return Interface(s, chunk)
 
 
-def get_addrs(s, interfaces, family = None):
-    """Match semantics only work for address family, so do a dump and return an
-    associative array (indexed by interface ID) of arrays of address info (each
-    element being an associative array)."""
+def get_addrs(s, interfaces, family = None, index = None):
+    """Match semantics only work for address family and (with strict checking)
+    interface ID, so do a dump and return an associative array (indexed by
+    interface ID) of arrays of Address objects.  Addresses belonging to
+    interfaces not in interfaces are skipped, in case the kernel is too old to
+    filter by interface ID."""
 
-    if family is None:
-        payload = rtnl.Rtgenmsg()
-        payload.rtgen_family = socket.AF_UNSPEC    # socket.AF_INET
+    if family is None and index is None:
+        payload = decode.rtgenmsg.pack(socket.AF_UNSPEC)    # socket.AF_INET
     else:
-        payload = if_addr.Ifaddrmsg()
-        ctypes.memset(ctypes.addressof(payload), 0, ctypes.sizeof(payload))
-        payload.ifa_family = family
-        ## payload.ifa_family = socket.AF_INET
-        ## payload.ifa_flags = 
-        ## payload.ifa_index = i
-
-    d = {}
-    for buf in s.transact(rtnl.RTM_GETADDR, payload):
+        # Family, prefix length, flags, scope, interface ID
+        payload = decode.ifaddrmsg.pack(family or socket.AF_UNSPEC, 0, 0, 0, index or 0)
+
+    strict = index is not None and s.set_strict_check(True)
+    try:
+        bufs = s.transact(constants.RTM_GETADDR, payload, constants.NLM_F_DUMP)
+    finally:
+        if strict:
+            s.set_strict_check(False)
+
+    return collect_addrs(s, bufs, interfaces)
+
+
+def collect_addrs(s, bufs, interfaces, d = None):
+    """Adds Address objects from a list of datagrams received in reply to
+    RTM_GETADDR to d (or a new associative array) and returns it."""
+    if d is None:
+        d = {}
+
+    for buf in bufs:
         # Get all the addresses and then store each one in a list belonging to
         # its respective interface ID
         for info in s.process_messages(buf, get_addr_info, interfaces):
-            if info['interface'] in d:
-                d[info['interface']].append(info)
+            if info is None:
+                continue
+            elif info.interface in d:
+                d[info.interface].append(info)
             else:
-                d[info['interface']] = [info]
+                d[info.interface] = [info]
 
     return d
 
 
-# @param chunk    A pointer to an array of the size of the sub-buffer
+# @param chunk    A view of the sub-buffer
 def get_addr_info(s, chunk, interfaces):
-    ## print("sub-buffer length:", len(chunk.contents))
-    ifaddrmsg = if_addr.Ifaddrmsg.from_pointer(chunk)
-    interface_info = interfaces[ifaddrmsg.ifa_index]
-
-    # Find the first Rtattr
-    offset = netlink.NLMSG_ALIGN(ctypes.sizeof(ifaddrmsg))
-    bytes_remaining = len(chunk.contents) - offset
-    ## attr = rtnl.Rtattr.from_address(ctypes.addressof(chunk.contents) + offset)
-    attr = if_addr.IFA_RTA(chunk.contents)
-
-    # Process attributes to find name, hardware address, etc.
-    info = {'interface': ifaddrmsg.ifa_index,
-            'prefix': ifaddrmsg.ifa_prefixlen,
-            'scope': ifaddrmsg.ifa_scope, 'flags': ifaddrmsg.ifa_flags}
-    unprocessed = []
-    while bytes_remaining > 0:
-        if attr.rta_type == if_addr.IFA_LABEL:
-            info['name'] = ctypes.cast(rtnl.RTA_DATA(attr), ctypes.c_char_p).value.decode('ascii')
-        elif attr.rta_type == if_addr.IFA_ADDRESS or attr.rta_type == if_addr.IFA_LOCAL:
-            addr_len = rtnl.RTA_PAYLOAD(attr)
-            addr_ptr = ctypes.cast(rtnl.RTA_DATA(attr),
-                                   ctypes.POINTER((ctypes.c_ubyte * addr_len)))
-            addr_bytes = (ctypes.c_char * addr_len).from_buffer(addr_ptr.contents).raw
-            addr_str = socket.inet_ntop(ifaddrmsg.ifa_family, addr_bytes)
-            if interface_info.flags & cpylmnl.linux.ifh.IFF_POINTOPOINT and \
-               attr.rta_type == if_addr.IFA_ADDRESS:
-                info['remote_addr'] = addr_str
-            else:
-                info['addr'] = addr_str
-        elif attr.rta_type == if_addr.IFA_FLAGS:
-            # This overrides ifaddrmsg.ifa_flags
-            ## if 'flags' in info:
-            ##     print("orig =", info['flags'])
-            info['flags'] = (ctypes.cast(rtnl.RTA_DATA(attr),
-                                         ctypes.POINTER(ctypes.c_uint))).contents.value
-            ## print("new =", info['flags'])
-        else:
-            unprocessed.append(attr.rta_type)
-            ## info[attr.rta_type] = 
-            ## print(binascii.hexlify(ctypes.cast(rtnl.RTA_DATA(attr), ctypes.POINTER(ctypes.c_char))[0:rtnl.RTA_PAYLOAD(attr)]))
-
-        attr, bytes_remaining = rtnl.RTA_NEXT(attr, bytes_remaining)
-
-    return info
+    ## print("sub-buffer length:", len(chunk))
+    family, prefixlen, flags, scope, index = decode.ifaddrmsg.unpack_from(chunk)
+    if index not in interfaces:
+        return None
 
+    return Address(index, family, prefixlen, scope, chunk)
@@ -0,0 +1,130 @@
+"""Keeps a model of the interfaces and their addresses up to date using
+rtnetlink notifications, showing each interface whenever it changes."""
+
+import errno
+
+from .interface import Interface
+from . import iplist
+from . import render
+from . import decode
+from . import constants
+from .globals import params
+
+
+# Multicast groups to subscribe to
+groups = constants.RTMGRP_LINK | constants.RTMGRP_IPV4_IFADDR | constants.RTMGRP_IPV6_IFADDR
+
+# The least that the kernel is asked to queue for the notification socket
+min_rcvbuf = 1024 * 1024
+
+
+class Model(object):
+    """Interfaces (indexed by ID) and lists of their addresses, in the same
+    form as get_interfaces() and get_addrs() return them."""
+
+    def __init__(self):
+        self.interfaces = {}
+        self.addrs_by_interface = {}
+
+
+    def load(self, s):
+        """Replaces the model's contents with a fresh dump and returns the
+        IDs of interfaces that changed, plus a list of those that vanished."""
+        interfaces = iplist.get_interfaces(s)
+        addrs_by_interface = iplist.get_addrs(s, interfaces)
+
+        changed = set()
+        for index, i in interfaces.items():
+            if not i.same_as(self.interfaces.get(index)) or \
+               addr_keys(self.addrs_by_interface.get(index)) != addr_keys(addrs_by_interface.get(index)):
+                changed.add(index)
+        deleted = [i for index, i in self.interfaces.items() if index not in interfaces]
+
+        self.interfaces = interfaces
+        self.addrs_by_interface = addrs_by_interface
+        return changed, deleted
+
+
+    def apply(self, s, buf):
+        """Updates the model from a datagram of notifications and returns the
+        IDs of interfaces that changed, plus a list of those that vanished."""
+        changed = set()
+        deleted = []
+        for msg_type, flags, seq, chunk in decode.messages(buf):
+            if msg_type == constants.RTM_NEWLINK:
+                i = Interface(s, chunk)
+                if not i.same_as(self.interfaces.get(i.id)):
+                    changed.add(i.id)
+                self.interfaces[i.id] = i
+            elif msg_type == constants.RTM_DELLINK:
+                i = self.interfaces.pop(Interface(s, chunk).id, None)
+                if i is not None:
+                    self.addrs_by_interface.pop(i.id, None)
+                    changed.discard(i.id)
+                    deleted.append(i)
+            elif msg_type == constants.RTM_NEWADDR or msg_type == constants.RTM_DELADDR:
+                addr = iplist.get_addr_info(s, chunk, self.interfaces)
+                if addr is None:
+                    continue
+                # Drop any existing copy (e.g. with different flags)
+                addrs = [a for a in self.addrs_by_interface.get(addr.interface, [])
+                         if a.key() != addr.key()]
+                if msg_type == constants.RTM_NEWADDR:
+                    addrs.append(addr)
+                self.addrs_by_interface[addr.interface] = addrs
+                changed.add(addr.interface)
+
+        return changed, deleted
+
+
+
+def size_rcvbuf(events, s):
+    """Lets events queue notifications about everything changing at once,
+    going by how much s received when loading the model, so that they're
+    less likely to be dropped (which means loading the model again)."""
+    events.set_rcvbuf(max(min_rcvbuf, 2 * s.received))
+
+
+def addr_keys(addrs):
+    return set(a.key() + (a.scope, a.flags) for a in addrs or [])
+
+
+def monitor(events, s):
+    """Loads the model using s and then shows interfaces as notifications
+    arrive on events (which must be subscribed to the groups above) until
+    interrupted.  If notifications are lost because the kernel's buffer
+    overflowed, the model is reloaded."""
+    model = Model()
+    model.load(s)
+    size_rcvbuf(events, s)
+
+    r = render.make_renderer()
+    if not r.incremental:
+        # A single JSON document can't be written a change at a time, so
+        # write each batch of changes as an array on a line of its own
+        r.indent = None
+    try:
+        while True:
+            try:
+                events.rbuf.reset()
+                changed, deleted = model.apply(events, events.recv_msg())
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # Some notifications were dropped, so start again from scratch
+                changed, deleted = model.load(s)
+
+            show_changes(r, model, changed, deleted)
+    except KeyboardInterrupt:
+        return 0
+
+
+def show_changes(r, model, changed, deleted):
+    for i in deleted:
+        r.deleted(i)
+    fields = params['sort']
+    grouping = not params['no-grouping']
+    for i in sorted((model.interfaces[index] for index in changed),
+                    key=lambda i: i.sort_key(fields, grouping)):
+        r.link(i, model.addrs_by_interface.get(i.id, []))
+    r.flush()
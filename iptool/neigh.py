@@ -0,0 +1,111 @@
+"""Dumps the neighbour (ARP/NDP) table a datagram at a time and shows each
+entry as it goes, so that memory use stays flat however big the table is.
+Entries are filtered on their fixed-size header before any attributes are
+decoded."""
+
+import socket
+
+from . import iplist
+from . import render
+from . import util
+from . import decode
+from . import constants
+from . import timing
+
+
+# In the order they're shown
+nud_states = ( (constants.NUD_INCOMPLETE,	"incomplete"),
+               (constants.NUD_REACHABLE,	"reachable"),
+               (constants.NUD_STALE,	"stale"),
+               (constants.NUD_DELAY,	"delay"),
+               (constants.NUD_PROBE,	"probe"),
+               (constants.NUD_FAILED,	"failed"),
+               (constants.NUD_NOARP,	"noarp"),
+               (constants.NUD_PERMANENT,	"permanent") )
+
+state_bits = dict((name, bit) for bit, name in nud_states)
+
+# How many entries to buffer before writing them out
+batch_size = 1024
+
+
+class Neighbour(object):
+    # dst and lladdr are strings, or None if the kernel didn't supply them
+    __slots__ = ('family', 'ifindex', 'state', 'flags', 'dst', 'lladdr')
+
+    def __init__(self, family, ifindex, state, flags, chunk):
+        self.family = family
+        self.ifindex = ifindex
+        self.state = state
+        self.flags = flags
+        self.dst = self.lladdr = None
+        for rta_type, data in decode.attrs(chunk, decode.NDMSG_LEN):
+            if rta_type == constants.NDA_DST:
+                self.dst = socket.inet_ntop(family, bytes(data))
+            elif rta_type == constants.NDA_LLADDR:
+                self.lladdr = util.decode_mac_addr(data)
+            elif timing.stats is not None:
+                timing.stats.unknown_attr("neigh", rta_type)
+
+
+    def state_names(self):
+        return [name for bit, name in nud_states if self.state & bit] or ["none"]
+
+
+    def is_router(self):
+        return bool(self.flags & constants.NTF_ROUTER)
+
+
+
+# @param chunk    A view of the sub-buffer
+# @param index    Only return entries for this interface ID, if not None
+# @param states   Only return entries in one of these NUD_* states, if nonzero
+def get_neigh_info(s, chunk, index, states):
+    family, ifindex, state, flags, ndm_type = decode.ndmsg.unpack_from(chunk)
+    if index is not None and ifindex != index:
+        return None
+    if states and not state & states:
+        return None
+    return Neighbour(family, ifindex, state, flags, chunk)
+
+
+def get_neighbours(s, index = None, states = 0, family = socket.AF_UNSPEC):
+    """Generates a Neighbour object for each entry in the table.  Unless the
+    kernel is too old, filtering by interface ID is done by the kernel."""
+    # Family, interface ID, state, flags, type; the rest must be 0 with
+    # strict checking
+    payload = decode.ndmsg.pack(family, 0, 0, 0, 0)
+    if index is not None:
+        payload += decode.pack_attr(constants.NDA_IFINDEX, decode.u32.pack(index))
+
+    strict = index is not None and s.set_strict_check(True)
+    try:
+        for buf in s.transact_iter(constants.RTM_GETNEIGH, payload):
+            for neighbour in s.process_messages(buf, get_neigh_info, index, states):
+                if neighbour is not None:
+                    yield neighbour
+    finally:
+        if strict:
+            s.set_strict_check(False)
+
+
+def show_neighbours(s, name = None, states = 0):
+    """Shows the neighbour table, optionally only for the interface called
+    name.  Raises OSError if there's no such interface."""
+    if name is not None:
+        interfaces = iplist.get_interface(s, name=name)
+        index, = interfaces.keys()
+    else:
+        interfaces = iplist.get_interfaces(s)
+        index = None
+
+    r = render.make_renderer()
+    count = 0
+    for neighbour in get_neighbours(s, index, states):
+        i = interfaces.get(neighbour.ifindex)
+        r.neighbour(neighbour, i.name if i is not None else "if%d" % neighbour.ifindex)
+        count += 1
+        if r.incremental and count % batch_size == 0:
+            r.flush()
+    r.flush()
+    return 0
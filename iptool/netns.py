@@ -0,0 +1,126 @@
+"""Dumps interfaces and addresses from every network namespace on the host in
+one process, using a pool of threads.
+
+Each worker thread switches to a namespace with setns(2) just long enough to
+create a netlink socket and then switches back; a netlink socket stays in the
+namespace it was created in, so the dump itself needs nothing special.  Only
+the calling thread's namespace is changed, so the others are unaffected.
+"""
+
+import os
+import glob
+import ctypes
+import ctypes.util
+import concurrent.futures
+
+from . import iplist
+
+
+CLONE_NEWNET = 0x40000000
+
+# Upper limit on the number of namespaces being dumped at once
+max_workers = 16
+
+# Label used for the namespace iptool is running in
+current_label = "current"
+
+libc = None
+
+
+def setns(fd, nstype):
+    """Calls setns(2), which the os module lacks before Python 3.12."""
+    global libc
+    if hasattr(os, 'setns'):
+        os.setns(fd, nstype)
+        return
+    if libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if libc.setns(fd, nstype) != 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+
+
+def discover():
+    """Returns a list of (label, path) tuples, one per network namespace,
+    starting with the current one.  Namespaces named by "ip netns add" are
+    labelled with their name and others with the PID of a process in them.
+    The same namespace is usually reachable by many paths, so they're
+    deduplicated by device and inode number."""
+    candidates = [(current_label, "/proc/self/ns/net")]
+    candidates.extend((os.path.basename(path), path) for path in sorted(glob.glob("/run/netns/*")))
+    pids = sorted(int(entry) for entry in os.listdir("/proc") if entry.isdigit())
+    candidates.extend(("pid %d" % pid, "/proc/%d/ns/net" % pid) for pid in pids)
+
+    seen = set()
+    namespaces = []
+    for label, path in candidates:
+        try:
+            st = os.stat(path)
+        except OSError:
+            # The process has exited, or isn't ours to look at
+            continue
+        if (st.st_dev, st.st_ino) not in seen:
+            seen.add((st.st_dev, st.st_ino))
+            namespaces.append((label, path))
+
+    return namespaces
+
+
+def open_socket(path, make_socket):
+    """Returns a new socket from make_socket() that belongs to the network
+    namespace at path, leaving the calling thread where it was."""
+    target = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        original = os.open("/proc/thread-self/ns/net", os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            setns(target, CLONE_NEWNET)
+            try:
+                return make_socket()
+            finally:
+                setns(original, CLONE_NEWNET)
+        finally:
+            os.close(original)
+    finally:
+        os.close(target)
+
+
+def dump(label, path, make_socket):
+    """Runs in a worker thread and returns the same structures as
+    get_interfaces() and get_addrs(), with each Interface labelled."""
+    if label == current_label:
+        s = make_socket()
+    else:
+        s = open_socket(path, make_socket)
+    try:
+        interfaces = iplist.get_interfaces(s)
+        addrs_by_interface = iplist.get_addrs(s, interfaces)
+    finally:
+        s.close()
+
+    for i in interfaces.values():
+        i.netns = label
+    return interfaces, addrs_by_interface
+
+
+def get_all(make_socket, namespaces):
+    """Dumps each namespace at the same time as up to max_workers others.
+    @param make_socket  A function that returns a new NetlinkSocket
+    @param namespaces   A list of (label, path) tuples, e.g. from discover()
+    @return             A list of (label, interfaces, addrs_by_interface)
+                        tuples in the same order as namespaces, and a list of
+                        (label, OSError) tuples for those that couldn't be
+                        dumped (e.g. for lack of privileges)
+    """
+    results = []
+    failures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(namespaces) or 1)) as pool:
+        futures = [pool.submit(dump, label, path, make_socket) for label, path in namespaces]
+        for (label, path), future in zip(namespaces, futures):
+            try:
+                interfaces, addrs_by_interface = future.result()
+            except OSError as e:
+                failures.append((label, e))
+            else:
+                results.append((label, interfaces, addrs_by_interface))
+
+    return results, failures
@@ -0,0 +1,87 @@
+"""Runs several netlink dumps at the same time, one per socket, so that the
+total latency is roughly that of the slowest one rather than the sum."""
+
+import selectors
+
+from . import interrupted_error
+from . import iplist
+from . import decode
+from . import constants
+from . import timing
+
+
+def dump_concurrently(requests):
+    """Sends every request and then receives the replies in whatever order
+    they arrive.  Dumps that the kernel says were interrupted by changes are
+    started again, like NetlinkSocket.transact() does.
+    @param requests  A list of (socket, msg_type, payload) tuples; each
+                     NetlinkSocket must appear only once
+    @return          A list of datagram lists, in the same order as requests
+    """
+    results = [[] for r in requests]
+    todo = list(range(len(requests)))
+    for attempt in range(requests[0][0].max_restarts + 1):
+        for k, buf, finished in stream_dumps([requests[n] for n in todo]):
+            results[todo[k]].append(buf)
+
+        # Start again any dumps that were interrupted by changes
+        todo = [n for n in todo if requests[n][0].interrupted]
+        if not todo:
+            return results
+        for n in todo:
+            results[n] = []
+        if timing.stats is not None:
+            timing.stats.count("dumps restarted", len(todo))
+
+    raise interrupted_error()
+
+
+def stream_dumps(requests, reuse = False):
+    """Sends every request and then generates an (index into requests,
+    datagram, finished) tuple for each datagram as it arrives.
+    @param reuse  If True, each datagram is only valid until the next one from
+                  the same socket is generated
+    """
+    sel = selectors.DefaultSelector()
+    try:
+        for n, (s, msg_type, payload) in enumerate(requests):
+            s.start(msg_type, payload)
+            sel.register(s.sock, selectors.EVENT_READ, n)
+
+        pending = len(requests)
+        while pending > 0:
+            for key, events in sel.select():
+                buf, finished = requests[key.data][0].recv_part(reuse)
+                if finished:
+                    sel.unregister(key.fileobj)
+                    pending -= 1
+                yield key.data, buf, finished
+    finally:
+        sel.close()
+
+
+def get_interfaces_and_addrs(link_sock, addr_socks):
+    """Dumps links on one socket while dumping each address family on its own
+    socket, then returns the same structures as get_interfaces() and
+    get_addrs() would.
+    @param addr_socks  An associative array mapping address families (e.g.
+                       socket.AF_INET) to the NetlinkSocket to use for each
+    """
+    requests = [(link_sock, constants.RTM_GETLINK, iplist.link_payload())]
+    for family, s in addr_socks.items():
+        requests.append((s, constants.RTM_GETADDR, family_payload(family)))
+
+    with timing.phase("dump parallel"):
+        results = dump_concurrently(requests)
+
+    # Address info depends on the interface flags, so links come first
+    interfaces = iplist.collect_interfaces(link_sock, results[0])
+    addrs_by_interface = {}
+    for (s, msg_type, payload), bufs in zip(requests[1:], results[1:]):
+        iplist.collect_addrs(s, bufs, interfaces, addrs_by_interface)
+
+    return interfaces, addrs_by_interface
+
+
+def family_payload(family):
+    return decode.rtgenmsg.pack(family)
@@ -0,0 +1,58 @@
+"""A base class for records (e.g. Interface) that decode their attributes
+lazily.  In a single pass over its netlink message's rtattr chain, a record
+copies the attributes it knows how to decode and notes the offset of each.
+Each field is decoded the first time it's read and the result is stored in
+the field's slot, so later reads cost no more than for any other attribute
+and fields that are never read cost nothing.
+"""
+
+from . import decode
+from . import timing
+
+
+class Record(object):
+    # raw is a copy of the message (from the header struct on) with only the
+    # rtattrs in attr_types, and offsets maps rta_types to where they are in it
+    __slots__ = ('raw', 'offsets')
+
+    # Subclasses map field names to functions that take the record and
+    # return the field's value
+    decoders = {}
+    # The rta_types that the decoders use, and the name to count others
+    # under with --stats
+    attr_types = frozenset()
+    kind = None
+
+    # Warning: don't store chunk or any views of it because the receive buffer
+    # it's in gets reused
+    def index_attrs(self, chunk, offset):
+        """Copies the message, leaving out attributes that no decoder uses,
+        and notes where the others are.
+        @param offset   Where the rtattr chain starts, i.e. the size of the
+                        header struct
+        """
+        if timing.stats is not None:
+            stats = timing.stats
+            self.raw, self.offsets = decode.compact_attrs(chunk, offset, self.attr_types,
+                                                          lambda t: stats.unknown_attr(self.kind, t))
+        else:
+            self.raw, self.offsets = decode.compact_attrs(chunk, offset, self.attr_types)
+
+
+    def __getattr__(self, name):
+        # Only called when a slot hasn't been set yet
+        decoder = self.decoders.get(name)
+        if decoder is None:
+            raise AttributeError("%r object has no attribute %r" % (type(self).__name__, name))
+        value = decoder(self)
+        setattr(self, name, value)
+        return value
+
+
+    def attr(self, rta_type):
+        """Returns a view of an attribute's payload, or None if the kernel
+        didn't supply it."""
+        offset = self.offsets.get(rta_type)
+        if offset is None:
+            return None
+        return decode.attr_at(self.raw, offset)
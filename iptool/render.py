@@ -0,0 +1,391 @@
+"""Turns Interface and Address records into output.  Each renderer collects
+its output in a buffer which is written in one go by flush(), rather than
+writing a line at a time.
+
+  - TextRenderer: the human-readable format
+  - JsonRenderer: a single JSON array of interfaces
+  - NdjsonRenderer: one JSON object per line, which suits streaming
+"""
+
+import sys
+import socket
+
+from . import util
+from . import constants
+from .globals import params
+
+
+family_names = { socket.AF_INET: "inet", socket.AF_INET6: "inet6" }
+
+
+class TextRenderer(object):
+    # Whether flush() may be called part-way through a list of results
+    incremental = True
+
+    def __init__(self, options = None, dest = None):
+        """@param options  A globals.Options, by default params
+        @param dest        A file to write to, by default stdout"""
+        self.options = params if options is None else options
+        self.dest = dest
+        self.lines = []
+        self.count = 0
+
+
+    def start_item(self):
+        self.count += 1
+        if self.options['blank-lines'] and self.count > 1:
+            self.lines.append("")
+
+
+    def link(self, i, addrs):
+        """Adds an interface and a list of its Address objects."""
+        self.start_item()
+        self.lines.append(link_line(i))
+
+        include_link_local = self.options['verbose'] >= 2
+        ## TO-DO: sort
+        if_addrs = [addr for addr in addrs if addr.scope != constants.RT_SCOPE_LINK or include_link_local]
+        if if_addrs:
+            for addr in if_addrs:
+                self.lines.append(addr_line(i, addr))
+        else:
+            self.lines.append("    no addresses")
+
+
+    def deleted(self, i):
+        self.start_item()
+        self.lines.append("%s (deleted; ID: %d)" % (i.name, i.id))
+
+
+    def lookup(self, record):
+        """Adds the result of looking up a route, as generated by
+        route.resolve()."""
+        if 'error' in record:
+            self.lines.append("%s: %s" % (record['addr'], record['error']))
+            return
+
+        if record['type'] == "unicast":
+            target = record['dev']
+        elif record['dev'] is not None:
+            target = "%s %s" % (record['type'], record['dev'])
+        else:
+            target = record['type']
+        extra_info = []
+        if record['gateway'] is not None:
+            extra_info.append("via " + record['gateway'])
+        if record['prefsrc'] is not None:
+            extra_info.append("src " + record['prefsrc'])
+        extra_info.append("route " + record['route'])
+        self.lines.append(util.add_extra("%s: %s" % (record['addr'], target), extra_info))
+
+
+    def found(self, record):
+        """Adds the addresses found for a query, as generated by
+        addrindex.find()."""
+        if 'error' in record:
+            self.lines.append("%s: %s" % (record['query'], record['error']))
+            return
+
+        for match in record['matches']:
+            self.lines.append("%s: %s %s/%d" % (record['query'], match['dev'], match['addr'],
+                                               match['prefix']))
+
+
+    def address(self, a, dev):
+        """Adds an Address, which belongs to the interface called dev."""
+        if a.scope == constants.RT_SCOPE_LINK and self.options['verbose'] < 2:
+            return
+        extra_info = [util.decode_scope(a.scope)]
+        if extra_info == ['global']:
+            extra_info = []
+        if a.remote_addr is not None:
+            extra_info.append("remote: %s" % a.remote_addr)
+        self.lines.append(util.add_extra("%s/%d: %s" % (a.addr, a.prefix, dev), extra_info))
+
+
+    def neighbour(self, n, dev):
+        """Adds a neigh.Neighbour, which is on the interface called dev."""
+        extra_info = [dev] + n.state_names()
+        if n.is_router():
+            extra_info.append("router")
+        self.lines.append(util.add_extra("%s: %s" % (n.dst, n.lladdr or "no MAC addr"), extra_info))
+
+
+    def tree(self, record):
+        """Adds a tree of interfaces, as generated by
+        topology.Topology.subtree()."""
+        self.lines.append(tree_line(record))
+        self.add_children(record['children'], "")
+
+
+    def add_children(self, children, indent):
+        for child in children:
+            last = child is children[-1]
+            self.lines.append(indent + ("`-- " if last else "|-- ") + tree_line(child))
+            self.add_children(child['children'], indent + ("    " if last else "|   "))
+
+
+    def rates(self, rows):
+        """Adds a table of rates, as generated by top.busiest()."""
+        self.start_item()
+        self.lines.append(rates_format % ("interface", "rx bit/s", "tx bit/s", "rx pkt/s",
+                                          "tx pkt/s", "errors/s", "drops/s"))
+        for row in rows:
+            self.lines.append(rates_format % (row['name'], si(row['rx_bps']), si(row['tx_bps']),
+                                              si(row['rx_pps']), si(row['tx_pps']),
+                                              si(row['errors']), si(row['drops'])))
+
+
+    def flush(self):
+        if self.lines:
+            # Look stdout up each time, as it may be redirected (e.g. by the
+            # server)
+            dest = self.dest or sys.stdout
+            dest.write("\n".join(self.lines) + "\n")
+            dest.flush()
+            self.lines = []
+
+
+
+class NdjsonRenderer(object):
+    incremental = True
+
+    def __init__(self, options = None, dest = None):
+        # Not imported at the top, as text output is the common case
+        import json
+        self.dumps = json.dumps
+        self.options = params if options is None else options
+        self.dest = dest
+        self.lines = []
+
+
+    def link(self, i, addrs):
+        self.lines.append(self.dumps(link_record(i, addrs)))
+
+
+    def deleted(self, i):
+        self.lines.append(self.dumps({ 'name': i.name, 'id': i.id, 'deleted': True }))
+
+
+    def lookup(self, record):
+        self.lines.append(self.dumps(record))
+
+
+    def found(self, record):
+        self.lines.append(self.dumps(record))
+
+
+    def address(self, a, dev):
+        self.lines.append(self.dumps(located_addr_record(a, dev)))
+
+
+    def neighbour(self, n, dev):
+        self.lines.append(self.dumps(neighbour_record(n, dev)))
+
+
+    def tree(self, record):
+        self.lines.append(self.dumps(record))
+
+
+    def rates(self, rows):
+        self.lines.extend(self.dumps(row) for row in rows)
+
+
+    def flush(self):
+        if self.lines:
+            dest = self.dest or sys.stdout
+            dest.write("\n".join(self.lines) + "\n")
+            dest.flush()
+            self.lines = []
+
+
+
+class JsonRenderer(object):
+    # Output can't be written in pieces, as it's a single document
+    incremental = False
+
+    def __init__(self, options = None, dest = None):
+        import json
+        self.dumps = json.dumps
+        self.options = params if options is None else options
+        self.dest = dest
+        self.records = []
+        # None puts each document written by flush() on a single line
+        self.indent = 2
+
+
+    def link(self, i, addrs):
+        self.records.append(link_record(i, addrs))
+
+
+    def deleted(self, i):
+        self.records.append({ 'name': i.name, 'id': i.id, 'deleted': True })
+
+
+    def lookup(self, record):
+        self.records.append(record)
+
+
+    def found(self, record):
+        self.records.append(record)
+
+
+    def address(self, a, dev):
+        self.records.append(located_addr_record(a, dev))
+
+
+    def neighbour(self, n, dev):
+        self.records.append(neighbour_record(n, dev))
+
+
+    def tree(self, record):
+        self.records.append(record)
+
+
+    def rates(self, rows):
+        self.records.extend(rows)
+
+
+    def flush(self):
+        if self.records:
+            dest = self.dest or sys.stdout
+            dest.write(self.dumps(self.records, indent=self.indent) + "\n")
+            dest.flush()
+            self.records = []
+
+
+
+renderers = { 'text': TextRenderer, 'json': JsonRenderer, 'ndjson': NdjsonRenderer }
+
+
+rates_format = "%-16s %9s %9s %9s %9s %9s %9s"
+
+
+def si(value):
+    """Formats a number using SI prefixes, e.g. 1.5M."""
+    if value < 999.5:
+        return "%.0f" % value
+    for prefix in "kMGTP":
+        value /= 1000
+        if value < 999.95:
+            break
+    return "%.1f%s" % (value, prefix)
+
+
+def make_renderer(options = None, dest = None):
+    """Returns a renderer for the format chosen on the command line, or in
+    options (a globals.Options) if given."""
+    if options is None:
+        options = params
+    return renderers[options['format'] or 'text'](options, dest)
+
+
+def link_line(i):
+    t = i.link_type
+    extra_info = [i.get_state()]
+    extra_info.append("ID: %d" % i.id)
+    if i.netns is not None:
+        extra_info.append("netns: %s" % i.netns)
+    if i.hwaddr is not None and t != 'loopback':
+        extra_info.append("MAC addr: " + i.hwaddr)
+    if i.link_info is not None:
+        if 'kind' in i.link_info:
+            # treat it as a subtype if the actual link type wasn't "other"
+            ## extra_info.append("sub-type: " + i.link_info['kind'])
+            t = "%s (%s)" % (t, i.link_info['kind'])
+        if 'data' in i.link_info:
+            if 'vlan_id' in i.link_info['data']:
+                extra_info.append("VLAN ID: %d" % i.link_info['data']['vlan_id'])
+            if 'vlan_flags' in i.link_info['data']:
+                extra_info.append("VLAN flags: %04x" % i.link_info['data']['vlan_flags'])
+            if 'unknown' in i.link_info['data']:
+                extra_info.append(i.link_info['data']['unknown'])
+
+    if i.parent_link is not None:
+        return "%s [%d] (%s; %s):" % (i.name, i.parent_link, t, "; ".join(extra_info))
+    else:
+        return "%s (%s; %s):" % (i.name, t, "; ".join(extra_info))
+
+
+def addr_line(i, addr_info):
+    extra_info = [util.decode_scope(addr_info.scope)]
+    if extra_info == ['global']:
+        extra_info = []
+    ## if i.flags & constants.IFF_POINTOPOINT:
+    if addr_info.remote_addr is not None:
+        extra_info.append("remote: %s" % addr_info.remote_addr)
+    # Only show the flags if they're not just IFA_F_PERMANENT
+    ## addr_info.flags
+    if addr_info.name is not None and addr_info.name != i.name:
+        return util.add_extra("    %s: %s/%d" % (addr_info.name, addr_info.addr, addr_info.prefix),
+                              extra_info)
+    elif addr_info.addr is not None:
+        return util.add_extra("    %s/%d" % (addr_info.addr, addr_info.prefix), extra_info)
+    else:
+        return util.add_extra("    no local address", extra_info)
+    ## "    %s/%d (%d [%04x])" % (addr_info.addr, addr_info.prefix, addr_info.scope, addr_info.flags)
+
+
+def link_record(i, addrs):
+    """Returns an associative array describing an interface, suitable for
+    JSON.  Unlike the text format, link-local addresses are always included."""
+    return { 'name': i.name,
+             'id': i.id,
+             'netns': i.netns,
+             'type': i.link_type,
+             'state': i.get_state(),
+             'flags': i.flags,
+             'mtu': i.mtu,
+             'hwaddr': i.hwaddr,
+             'parent_link': i.parent_link,
+             'master': i.master,
+             'link_info': i.link_info,
+             'addresses': [addr_record(a) for a in addrs] }
+
+
+def addr_record(a):
+    return { 'family': family_names.get(a.family, a.family),
+             'addr': a.addr,
+             'prefix': a.prefix,
+             'scope': util.decode_scope(a.scope),
+             'flags': a.flags,
+             'remote_addr': a.remote_addr,
+             'label': a.name }
+
+
+def located_addr_record(a, dev):
+    """Like addr_record(), but also gives the interface (called dev) it
+    belongs to."""
+    record = addr_record(a)
+    record['dev'] = dev
+    return record
+
+
+def tree_line(record):
+    extra_info = [record['state'], "ID: %d" % record['id']]
+    if record['relation'] is not None:
+        extra_info.append(record['relation'])
+    return "%s (%s; %s)" % (record['name'], record['kind'] or record['type'],
+                            "; ".join(extra_info))
+
+
+def tree_record(i, relation):
+    """Returns an associative array describing an interface in a tree, without
+    its children.
+    @param relation  How it's related to its parent (see topology), or None
+    """
+    return { 'name': i.name,
+             'id': i.id,
+             'type': i.link_type,
+             'kind': i.link_kind(),
+             'state': i.get_state(),
+             'relation': relation }
+
+
+def neighbour_record(n, dev):
+    return { 'family': family_names.get(n.family, n.family),
+             'dst': n.dst,
+             'lladdr': n.lladdr,
+             'dev': dev,
+             'state': n.state_names(),
+             'router': n.is_router() }
@@ -0,0 +1,221 @@
+"""Dumps the routing tables into an index that does longest-prefix-match
+lookups in memory, so that many destinations can be resolved in bulk rather
+than asking the kernel about each one (as "ip route get" does).
+
+Only the tables used by the default policy routing rules (local, main and
+default) are consulted, in that order; other rules are not evaluated.
+"""
+
+import sys
+import socket
+
+from . import iplist
+from . import render
+from . import decode
+from . import constants
+from . import timing
+
+
+# Tables consulted, in the order of the default policy routing rules
+lookup_tables = (constants.RT_TABLE_LOCAL, constants.RT_TABLE_MAIN, constants.RT_TABLE_DEFAULT)
+
+address_bits = { socket.AF_INET: 32, socket.AF_INET6: 128 }
+
+route_types = { constants.RTN_UNSPEC:	"none",
+                constants.RTN_UNICAST:	"unicast",
+                constants.RTN_LOCAL:	"local",
+                constants.RTN_BROADCAST:	"broadcast",
+                constants.RTN_ANYCAST:	"anycast",
+                constants.RTN_MULTICAST:	"multicast",
+                constants.RTN_BLACKHOLE:	"blackhole",
+                constants.RTN_UNREACHABLE:	"unreachable",
+                constants.RTN_PROHIBIT:	"prohibit",
+                constants.RTN_THROW:	"throw" }
+
+# How many results to buffer before writing them out
+batch_size = 1024
+
+
+class Route(object):
+    # dst is the destination prefix as an integer; gateway and prefsrc are
+    # strings.  Attributes that weren't supplied by the kernel are None,
+    # apart from dst and priority which default to 0.
+    __slots__ = ('family', 'dst', 'dst_len', 'src_len', 'table', 'type', 'priority',
+                 'oif', 'gateway', 'prefsrc')
+
+    def __init__(self, s, chunk):
+        family, dst_len, src_len, tos, table, protocol, scope, rtm_type, flags = \
+            decode.rtmsg.unpack_from(chunk)
+        self.family = family
+        self.dst_len = dst_len
+        self.src_len = src_len
+        self.table = table
+        self.type = rtm_type
+        self.dst = self.priority = 0
+        self.oif = self.gateway = self.prefsrc = None
+        for rta_type, data in decode.attrs(chunk, decode.RTMSG_LEN):
+            if rta_type == constants.RTA_DST:
+                self.dst = int.from_bytes(data, 'big')
+            elif rta_type == constants.RTA_TABLE:
+                # Tables above 255 only appear here
+                self.table = decode.u32.unpack_from(data)[0]
+            elif rta_type == constants.RTA_OIF:
+                self.oif = decode.s32.unpack_from(data)[0]
+            elif rta_type == constants.RTA_GATEWAY:
+                self.gateway = socket.inet_ntop(family, bytes(data))
+            elif rta_type == constants.RTA_PREFSRC:
+                self.prefsrc = socket.inet_ntop(family, bytes(data))
+            elif rta_type == constants.RTA_PRIORITY:
+                self.priority = decode.u32.unpack_from(data)[0]
+            elif rta_type == constants.RTA_MULTIPATH and len(data) >= decode.rtnexthop.size:
+                # Just report the first next hop, as there's no way of
+                # knowing which one a given flow would be hashed to
+                length, nh_flags, hops, self.oif = decode.rtnexthop.unpack_from(data)
+                for nh_type, nh_data in decode.attrs(data[:length], decode.rtnexthop.size):
+                    if nh_type == constants.RTA_GATEWAY:
+                        self.gateway = socket.inet_ntop(family, bytes(nh_data))
+            elif timing.stats is not None:
+                timing.stats.unknown_attr("route", rta_type)
+
+
+    def prefix(self):
+        bits = address_bits[self.family]
+        return "%s/%d" % (socket.inet_ntop(self.family, self.dst.to_bytes(bits // 8, 'big')),
+                          self.dst_len)
+
+
+
+class RouteIndex(object):
+    """For each (family, table) pair, keeps an associative array per prefix
+    length that maps prefixes (i.e. the top dst_len bits of the destination)
+    to routes.  A lookup tries each length present, longest first, so the
+    number of probes depends on how many distinct lengths there are rather
+    than on the number of routes or the address size."""
+
+    def __init__(self):
+        self.prefixes = {}
+        self.lengths = {}   # prefix lengths for each (family, table), longest first
+
+
+    def add(self, route):
+        bits = address_bits.get(route.family)
+        if bits is None or route.src_len or route.dst_len > bits:
+            # Not IP, or a source-specific route which can't be matched here
+            return
+        key = (route.family, route.table)
+        by_length = self.prefixes.setdefault(key, {})
+        routes = by_length.get(route.dst_len)
+        if routes is None:
+            routes = by_length[route.dst_len] = {}
+            self.lengths[key] = sorted(by_length, reverse=True)
+
+        prefix = route.dst >> (bits - route.dst_len)
+        existing = routes.get(prefix)
+        # The kernel prefers the route with the lowest metric
+        if existing is None or route.priority < existing.priority:
+            routes[prefix] = route
+
+
+    def lookup(self, family, addr):
+        """Returns the Route for an address given as an integer, or None."""
+        bits = address_bits[family]
+        for table in lookup_tables:
+            key = (family, table)
+            by_length = self.prefixes.get(key)
+            if by_length is None:
+                continue
+            for length in self.lengths[key]:
+                route = by_length[length].get(addr >> (bits - length))
+                if route is not None:
+                    if route.type == constants.RTN_THROW:
+                        break   # carry on with the next table
+                    return route
+
+        return None
+
+
+
+def get_routes(s):
+    index = RouteIndex()
+    payload = decode.rtmsg.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0, 0, 0, 0)
+    for buf in s.transact(constants.RTM_GETROUTE, payload):
+        for route in s.process_messages(buf, Route):
+            index.add(route)
+
+    return index
+
+
+def parse_addr(text):
+    """Returns a (family, integer) tuple for an IPv4 or IPv6 address.  Raises
+    OSError if it isn't valid."""
+    family = socket.AF_INET6 if ':' in text else socket.AF_INET
+    return family, int.from_bytes(socket.inet_pton(family, text), 'big')
+
+
+def resolve(index, interfaces, addrs):
+    """Generates an associative array describing the route for each address."""
+    # Packets to local addresses go via the loopback interface, whichever
+    # interface the route names
+    loopback = None
+    for i in interfaces.values():
+        if i.flags & constants.IFF_LOOPBACK:
+            loopback = i.id
+
+    for text in addrs:
+        try:
+            family, addr = parse_addr(text)
+        except OSError:
+            yield { 'addr': text, 'error': "invalid address" }
+            continue
+
+        route = index.lookup(family, addr)
+        if route is None:
+            yield { 'addr': text, 'error': "no route" }
+            continue
+
+        oif = loopback if route.type == constants.RTN_LOCAL and loopback is not None else route.oif
+        if oif in interfaces:
+            dev = interfaces[oif].name
+        elif oif is not None:
+            dev = "if%d" % oif
+        else:
+            dev = None
+        yield { 'addr': text,
+                'type': route_types.get(route.type, str(route.type)),
+                'dev': dev,
+                'gateway': route.gateway,
+                'prefsrc': route.prefsrc,
+                'route': route.prefix(),
+                'table': route.table }
+
+
+def read_addrs(files):
+    """Generates each address in the files (one per line; "-" is stdin),
+    skipping blank lines and comments."""
+    for filename in files or ["-"]:
+        f = sys.stdin if filename == "-" else open(filename)
+        try:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def route_get(s, files):
+    """Shows the egress interface and next hop for each address in the
+    files.  Raises OSError if a file can't be read."""
+    interfaces = iplist.get_interfaces(s)
+    index = get_routes(s)
+
+    r = render.make_renderer()
+    count = 0
+    for record in resolve(index, interfaces, read_addrs(files)):
+        r.lookup(record)
+        count += 1
+        if r.incremental and count % batch_size == 0:
+            r.flush()
+    r.flush()
+    return 0
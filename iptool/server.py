@@ -0,0 +1,123 @@
+"""A resident daemon that keeps interface and address info up to date using
+rtnetlink notifications, and answers queries from "iptool --client" over a
+Unix domain socket without dumping anything from the kernel.
+
+The protocol is one JSON document each way: the client sends its argv (as an
+array) and the server replies with an object containing the exit status and
+whatever would have been written to stdout and stderr.
+"""
+
+import os
+import sys
+import io
+import json
+import errno
+import socket
+import selectors
+import contextlib
+import traceback
+
+from . import monitor
+
+
+# How long to wait for a client to send its query
+client_timeout = 2.0
+
+
+def default_path():
+    if os.getuid() == 0:
+        return "/run/iptool.sock"
+    else:
+        return os.path.join(os.environ.get('XDG_RUNTIME_DIR', "/tmp"), "iptool-%d.sock" % os.getuid())
+
+
+def serve(events, s, path, handler):
+    """Loads a monitor.Model using s and keeps it up to date from events
+    (which must be subscribed to monitor.groups) while answering queries on a
+    Unix socket at path, until interrupted.
+    @param handler  A function, i.e. fn(model, argv) that writes the answer
+                    to stdout and returns an exit code
+    """
+    model = monitor.Model()
+    model.load(s)
+    monitor.size_rcvbuf(events, s)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    listener.bind(path)
+    listener.listen(64)
+
+    sel = selectors.DefaultSelector()
+    sel.register(events.sock, selectors.EVENT_READ)
+    sel.register(listener, selectors.EVENT_READ)
+    try:
+        while True:
+            ready = [key.fileobj for key, mask in sel.select()]
+            # Apply changes before answering, so that answers are current
+            if events.sock in ready:
+                try:
+                    events.rbuf.reset()
+                    model.apply(events, events.recv_msg())
+                except OSError as e:
+                    if e.errno != errno.ENOBUFS:
+                        raise
+                    model.load(s)
+            if listener in ready:
+                conn, addr = listener.accept()
+                with conn:
+                    answer(conn, model, handler)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        sel.close()
+        listener.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+
+
+def answer(conn, model, handler):
+    conn.settimeout(client_timeout)
+    try:
+        argv = json.loads(recv_all(conn))
+    except (OSError, ValueError):
+        # Client gave up or sent rubbish; nothing useful can be done
+        return
+
+    out = io.StringIO()
+    err = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            status = handler(model, argv)
+        except Exception:
+            # Don't let one bad query take the server down
+            traceback.print_exc()
+            status = 1
+
+    response = { 'status': status or 0, 'stdout': out.getvalue(), 'stderr': err.getvalue() }
+    with contextlib.suppress(OSError):
+        conn.sendall(json.dumps(response).encode('utf-8'))
+
+
+def query(path, argv):
+    """Sends argv to the server at path, writes out its answer and returns
+    the exit code.  Raises OSError if the server can't be reached."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(path)
+        conn.sendall(json.dumps(argv).encode('utf-8'))
+        conn.shutdown(socket.SHUT_WR)
+        response = json.loads(recv_all(conn))
+
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+
+def recv_all(conn):
+    """Reads until the other end shuts down its side of the connection."""
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return b"".join(chunks).decode('utf-8')
+        chunks.append(chunk)
@@ -0,0 +1,118 @@
+"""Joins the link and address dumps by interface ID as they arrive, so that
+interfaces can be shown straight away without holding the whole of either
+dump in memory.
+
+This relies on the kernel walking its device list in the same order for each
+dump, which it does (by ID on newer kernels and by ID hash bucket on older
+ones).  Once every address dump has moved on to a later interface (or
+finished), an interface can't get any more addresses.
+
+If the orders ever disagree, an address can turn up after its interface has
+been shown.  It can't be added to the output any more, so it's counted under
+--stats as a late address, and from then on interfaces are held back until
+every dump has finished.  Addresses of interfaces that weren't in the link
+dump (e.g. added during it) are kept, and those interfaces are looked up at
+the end.
+"""
+
+from . import interrupted_error
+from . import iplist
+from . import parallel
+from . import decode
+from . import constants
+from . import timing
+
+
+def get_interfaces_and_addrs(link_sock, addr_socks):
+    """Generates an (Interface, Address list) tuple for each interface
+    as soon as all of its addresses are known.
+    @param addr_socks  An associative array mapping address families (e.g.
+                       socket.AF_INET) to the NetlinkSocket to use for each
+    """
+    requests = [(link_sock, constants.RTM_GETLINK, iplist.link_payload())]
+    for family, s in addr_socks.items():
+        requests.append((s, constants.RTM_GETADDR, parallel.family_payload(family)))
+
+    # Interfaces that have been seen but not yet generated, and their position
+    # in the kernel's device order
+    pending = {}
+    addrs = {}
+    position = {}
+    count = 0
+    # Copies of address messages for interfaces that haven't been seen (yet)
+    early = {}
+    # IDs of the interfaces that have been generated, and whether the dumps
+    # have kept to the same order so far
+    generated = set()
+    in_order = True
+    # The interface ID each address dump is up to; index 0 is unused
+    last = [None] * len(requests)
+    finished = [False] * len(requests)
+
+    for n, buf, done in parallel.stream_dumps(requests, True):
+        finished[n] = done
+        s = requests[n][0]
+        if n == 0:
+            for i in s.process_messages(buf, iplist.get_link_info):
+                count += 1
+                pending[i.id] = i
+                position[i.id] = count
+                addrs[i.id] = [iplist.get_addr_info(s, chunk, pending)
+                               for chunk in early.pop(i.id, ())]
+        else:
+            for index in s.process_messages(buf, take_addr, pending, addrs, early, generated):
+                last[n] = index
+                if index in generated:
+                    in_order = False
+
+        # Generate interfaces from the front of the queue until one is found
+        # that might still get addresses
+        for index in list(pending):
+            if not all(finished[k] or in_order and passed(last[k], index, position)
+                       for k in range(1, len(requests))):
+                break
+            del position[index]
+            generated.add(index)
+            yield pending.pop(index), addrs.pop(index)
+
+    # Interfaces have already been generated, so it's too late to start again
+    for s, msg_type, payload in requests:
+        if s.interrupted:
+            raise interrupted_error()
+
+    # The kernel's device orders disagreed, or interfaces were added during
+    # the dump, so look up the stragglers individually
+    for index, chunks in early.items():
+        try:
+            interfaces = iplist.get_interface(link_sock, index=index)
+        except OSError:
+            # Gone in the meantime
+            continue
+        for i in interfaces.values():
+            yield i, [iplist.get_addr_info(link_sock, chunk, interfaces) for chunk in chunks]
+
+
+def take_addr(s, chunk, pending, addrs, early, generated):
+    """Decodes an address message if its interface is pending, otherwise
+    keeps a copy for later unless the interface has already been generated.
+    Returns the interface ID."""
+    index = decode.ifaddrmsg.unpack_from(chunk)[4]
+    if index in pending:
+        addrs[index].append(iplist.get_addr_info(s, chunk, pending))
+    elif index in generated:
+        if timing.stats is not None:
+            timing.stats.count("late addresses")
+    else:
+        # The datagram's memory is about to be reused
+        early.setdefault(index, []).append(bytes(chunk))
+    return index
+
+
+def passed(current, index, position):
+    """Returns True if an address dump that is up to interface ID current has
+    moved past interface ID index."""
+    if current is None or current == index:
+        return False
+    # Interfaces that aren't pending haven't been seen yet, so they must come
+    # later in the order
+    return current not in position or position[current] > position[index]
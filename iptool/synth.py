@@ -0,0 +1,199 @@
+"""Builds realistic rtnetlink dumps from parameters rather than asking the
+kernel, along with a NetlinkSocket that replays them, so that parsing and
+rendering can be exercised (e.g. by iptool.bench) with no real socket and
+any number of interfaces.
+
+The interfaces are mostly veth devices, with some VLANs (on top of the
+previous veth, with nested IFLA_LINKINFO data) and tun devices, in roughly
+the proportions given.  Each has a mixture of IPv4, IPv6 global and IPv6
+link-local addresses.
+"""
+
+import os
+import socket
+
+from . import NetlinkSocket, ReceiveBuffer
+from . import decode
+from . import constants
+
+
+# The kernel fills datagrams up to about this size during a dump
+datagram_size = 32768
+
+ARPHRD_ETHER = 1
+ARPHRD_LOOPBACK = 772
+ARPHRD_NONE = 0xFFFE
+
+IFLA_TXQLEN = 13
+IFLA_STATS64_SIZE = 24 * 8
+IFA_CACHEINFO_SIZE = 16
+
+
+def message(msg_type, body, seq = 0, flags = constants.NLM_F_MULTI):
+    """Returns body (a header struct followed by rtattrs) with an Nlmsghdr
+    in front of it and padding after it."""
+    length = decode.NLMSG_HDRLEN + len(body)
+    hdr = decode.nlmsghdr.pack(length, msg_type, flags, seq, 0)
+    return (hdr + body).ljust(decode.align(length), b'\0')
+
+
+def attr_string(rta_type, s):
+    return decode.pack_attr(rta_type, s.encode('ascii') + b'\0')
+
+
+def link_message(index, name, kind = None, parent = None, vlan_id = None):
+    """Returns an RTM_NEWLINK message for an interface that is up.
+    @param kind     The IFLA_INFO_KIND, e.g. "veth", "vlan" or "tun", or
+                    None for the loopback interface
+    @param parent   The ID of the interface a VLAN is on top of
+    """
+    flags = constants.IFF_UP | constants.IFF_LOWER_UP
+    if kind is None:
+        ifi_type = ARPHRD_LOOPBACK
+        flags |= constants.IFF_LOOPBACK
+    elif kind == "tun":
+        ifi_type = ARPHRD_NONE
+        flags |= constants.IFF_POINTOPOINT
+    else:
+        ifi_type = ARPHRD_ETHER
+    body = [decode.ifinfomsg.pack(socket.AF_UNSPEC, ifi_type, index, flags, 0),
+            attr_string(constants.IFLA_IFNAME, name),
+            decode.pack_attr(IFLA_TXQLEN, decode.u32.pack(1000)),
+            decode.pack_attr(constants.IFLA_OPERSTATE, decode.u8.pack(constants.IF_OPER_UP)),
+            decode.pack_attr(constants.IFLA_MTU, decode.u32.pack(1500))]
+    if parent is not None:
+        body.append(decode.pack_attr(constants.IFLA_LINK, decode.s32.pack(parent)))
+    if kind is None:
+        body.append(decode.pack_attr(constants.IFLA_ADDRESS, bytes(6)))
+        body.append(decode.pack_attr(constants.IFLA_BROADCAST, bytes(6)))
+    elif kind != "tun":
+        mac = b'\x02\0' + index.to_bytes(4, 'big')
+        body.append(decode.pack_attr(constants.IFLA_ADDRESS, mac))
+        body.append(decode.pack_attr(constants.IFLA_BROADCAST, b'\xff' * 6))
+    body.append(decode.pack_attr(constants.IFLA_STATS64, bytes(IFLA_STATS64_SIZE)))
+    if kind is not None:
+        info = [attr_string(constants.IFLA_INFO_KIND, kind)]
+        if vlan_id is not None:
+            # struct ifla_vlan_flags: flags, mask
+            data = decode.pack_attr(constants.IFLA_VLAN_ID, decode.u16.pack(vlan_id)) + \
+                   decode.pack_attr(constants.IFLA_VLAN_FLAGS, decode.u32.pack(1) + decode.u32.pack(0xFFFFFFFF))
+            info.append(decode.pack_attr(constants.IFLA_INFO_DATA, data))
+        body.append(decode.pack_attr(constants.IFLA_LINKINFO, b"".join(info)))
+    return message(constants.RTM_NEWLINK, b"".join(body))
+
+
+def addr_message(index, family, addr, prefix, scope = constants.RT_SCOPE_UNIVERSE, label = None,
+                 peer = None):
+    """Returns an RTM_NEWADDR message.
+    @param addr  The address in packed form, e.g. from socket.inet_pton()
+    @param peer  The remote address (in packed form) of an IPv4
+                 point-to-point link
+    """
+    body = [decode.ifaddrmsg.pack(family, prefix, 0, scope, index),
+            decode.pack_attr(constants.IFA_ADDRESS, peer or addr)]
+    if family == socket.AF_INET:
+        body.append(decode.pack_attr(constants.IFA_LOCAL, addr))
+        if label is not None:
+            body.append(attr_string(constants.IFA_LABEL, label))
+    body.append(decode.pack_attr(constants.IFA_FLAGS, decode.u32.pack(0x80)))
+    body.append(decode.pack_attr(constants.IFA_CACHEINFO, bytes(IFA_CACHEINFO_SIZE)))
+    return message(constants.RTM_NEWADDR, b"".join(body))
+
+
+def datagrams(messages):
+    """Packs messages into datagrams the way the kernel does during a dump,
+    ending with a separate NLMSG_DONE."""
+    result = []
+    current = []
+    size = 0
+    for msg in messages:
+        if current and size + len(msg) > datagram_size:
+            result.append(b"".join(current))
+            current = []
+            size = 0
+        current.append(msg)
+        size += len(msg)
+    if current:
+        result.append(b"".join(current))
+    result.append(message(constants.NLMSG_DONE, decode.s32.pack(0)))
+    return result
+
+
+def interfaces(count, vlan_every = 10, tun_every = 20):
+    """Generates (index, name, kind, parent, vlan_id) tuples, starting with
+    the loopback interface."""
+    yield 1, "lo", None, None, None
+    for index in range(2, count + 1):
+        if index % tun_every == 0:
+            yield index, "tun%d" % index, "tun", None, None
+        elif index % vlan_every == 0:
+            yield index, "eth%d.%d" % (index - 1, index % 4096), "vlan", index - 1, index % 4096
+        else:
+            yield index, "eth%d" % index, "veth", None, None
+
+
+def addrs(index, name, count):
+    """Generates (family, addr, prefix, scope, label) tuples, cycling
+    through IPv4, IPv6 global and IPv6 link-local."""
+    for n in range(count):
+        if n % 3 == 0:
+            addr = bytes((10, (index >> 8) & 0xFF, index & 0xFF, n % 254 + 1))
+            yield socket.AF_INET, addr, 24, constants.RT_SCOPE_UNIVERSE, name
+        elif n % 3 == 1:
+            addr = b'\xfd\0' + index.to_bytes(6, 'big') + n.to_bytes(8, 'big')
+            yield socket.AF_INET6, addr, 64, constants.RT_SCOPE_UNIVERSE, None
+        else:
+            addr = b'\xfe\x80' + bytes(6) + index.to_bytes(8, 'big')
+            yield socket.AF_INET6, addr, 64, constants.RT_SCOPE_LINK, None
+
+
+def dump(interface_count, addrs_per_interface = 3, vlan_every = 10, tun_every = 20):
+    """Returns a pair of datagram lists, replying to RTM_GETLINK and
+    RTM_GETADDR respectively."""
+    links = []
+    addr_msgs = []
+    for index, name, kind, parent, vlan_id in interfaces(interface_count, vlan_every, tun_every):
+        links.append(link_message(index, name, kind, parent, vlan_id))
+        for family, addr, prefix, scope, label in addrs(index, name, addrs_per_interface):
+            if kind == "tun" and family == socket.AF_INET:
+                peer = addr[:3] + bytes(((addr[3] + 127) % 254 + 1,))
+                addr_msgs.append(addr_message(index, family, addr, 32, scope, label, peer))
+            else:
+                addr_msgs.append(addr_message(index, family, addr, prefix, scope, label))
+
+    return datagrams(links), datagrams(addr_msgs)
+
+
+
+class SyntheticSocket(NetlinkSocket):
+    """A NetlinkSocket that answers each request with canned datagrams
+    instead of asking the kernel."""
+
+    def __init__(self, replies):
+        """@param replies  An associative array mapping request types (e.g.
+                           RTM_GETLINK) to lists of datagrams"""
+        self.sock = None
+        self.rbuf = ReceiveBuffer()
+        self.seq = 0
+        self.pid = os.getpid()
+        self.replies = replies
+        self.pending = iter(())
+
+
+    def set_strict_check(self, enable):
+        return False
+
+
+    def send_msg(self, msg_type, payload, flags = constants.NLM_F_DUMP):
+        # The canned replies all have sequence number 0, so leave seq alone
+        self.msg_type = msg_type
+        self.pending = iter(self.replies[msg_type])
+
+
+    def recv_msg(self):
+        # Copy into the receive buffer like the real thing, so that the
+        # same memory is being read
+        datagram = next(self.pending)
+        view = self.rbuf.reserve(len(datagram))
+        view[:] = datagram
+        return view
@@ -0,0 +1,120 @@
+"""Optional instrumentation (--timings and --stats): how long each phase
+takes, and counts of what was received and decoded, including rtattr types
+that nothing understood.
+
+Instrumentation is off unless start() has been called, in which case stats
+holds the Stats object being collected into.  Code being measured uses
+phase() and checks stats for None before counting, so that it costs next to
+nothing otherwise.
+"""
+
+import sys
+import time
+
+from . import families
+
+
+stats = None
+
+# What each RTNL_FAMILY_* is called in timings and counters
+kinds = { families.RTNL_FAMILY_LINK:	"link",
+          families.RTNL_FAMILY_ADDR:	"addr",
+          families.RTNL_FAMILY_ROUTE:	"route",
+          families.RTNL_FAMILY_NEIGH:	"neigh" }
+
+
+class Stats(object):
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}   # seconds spent in each phase
+        self.counters = {}
+        self.unknown_attrs = {}     # maps message kinds to counts per rta_type
+
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def unknown_attr(self, kind, rta_type):
+        counts = self.unknown_attrs.setdefault(kind, {})
+        counts[rta_type] = counts.get(rta_type, 0) + 1
+
+
+    def report(self, timings, counters, as_json, dest = sys.stderr):
+        """Writes out the timings (in ms) and/or counters."""
+        self.timings['total'] = time.perf_counter() - self.started
+        if as_json:
+            import json
+            result = {}
+            if timings:
+                result['timings_ms'] = dict((name, t * 1000) for name, t in self.timings.items())
+            if counters:
+                result['counters'] = self.counters
+                result['unknown_rtattrs'] = dict((kind, dict((str(t), n) for t, n in counts.items()))
+                                                 for kind, counts in self.unknown_attrs.items())
+            print(json.dumps(result), file=dest)
+            return
+
+        if timings:
+            print("Timings (ms):", file=dest)
+            for name, t in self.timings.items():
+                print("  %-20s %10.3f" % (name, t * 1000), file=dest)
+        if counters:
+            print("Counters:", file=dest)
+            for name, n in self.counters.items():
+                print("  %-20s %10d" % (name, n), file=dest)
+            for kind, counts in sorted(self.unknown_attrs.items()):
+                print("  unknown %s rtattrs: %s" %
+                      (kind, ", ".join("%d (x%d)" % (t, n) for t, n in sorted(counts.items()))),
+                      file=dest)
+
+
+
+class Phase(object):
+    """A context manager that adds the time spent in it to a phase."""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stats.add_time(self.name, time.perf_counter() - self.start)
+
+
+
+class NullPhase(object):
+    def __enter__(self):
+        pass
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+null_phase = NullPhase()
+
+
+def kind(family):
+    return kinds.get(family, str(family))
+
+
+def start():
+    global stats
+    stats = Stats()
+
+
+def phase(name):
+    """Returns a context manager that times a phase, if instrumentation is
+    on."""
+    if stats is None:
+        return null_phase
+    return Phase(name)
@@ -0,0 +1,69 @@
+"""Repeatedly dumps interface counters and shows the busiest interfaces, a bit
+like top(1).  Only the name and IFLA_STATS64 are decoded from each link
+message, so that this stays cheap on hosts with many interfaces."""
+
+import time
+import errno
+import heapq
+import operator
+
+from . import counters
+from . import iplist
+from . import render
+from . import constants
+from .globals import params
+
+
+default_interval = 1.0
+default_count = 10
+
+
+def sample(s):
+    table = counters.CounterTable()
+    table.load(s, s.transact(constants.RTM_GETLINK, iplist.link_payload()))
+    return table
+
+
+def busiest(rates, table, count):
+    """Returns the count interfaces with the highest throughput (received plus
+    transmitted bytes) as a list of associative arrays, busiest first."""
+    score = list(map(operator.add, rates['rx_bytes'], rates['tx_bytes']))
+    rows = heapq.nlargest(count, range(len(score)), key=score.__getitem__)
+    return [ { 'name': table.names[row],
+               'id': table.ids[row],
+               'rx_bps': rates['rx_bytes'][row] * 8,
+               'tx_bps': rates['tx_bytes'][row] * 8,
+               'rx_pps': rates['rx_packets'][row],
+               'tx_pps': rates['tx_packets'][row],
+               'errors': rates['rx_errors'][row] + rates['tx_errors'][row],
+               'drops': rates['rx_dropped'][row] + rates['tx_dropped'][row] }
+             for row in rows ]
+
+
+def top(s):
+    """Shows the busiest interfaces every interval until interrupted."""
+    interval = params['interval'] or default_interval
+    count = params['count'] or default_count
+    r = render.make_renderer()
+    if not r.incremental:
+        # A single JSON document can't be written a tick at a time, so
+        # write each tick's array on a line of its own
+        r.indent = None
+
+    try:
+        old = sample(s)
+        then = time.monotonic()
+        while True:
+            time.sleep(max(0.0, then + interval - time.monotonic()))
+            new = sample(s)
+            now = time.monotonic()
+            r.rates(busiest(counters.rates(old, new, now - then), new, count))
+            r.flush()
+            old, then = new, now
+    except KeyboardInterrupt:
+        return 0
+    except OSError as e:
+        # Running out of samples is how a replayed capture ends
+        if params['replay'] and e.errno == errno.ENODATA:
+            return 0
+        raise
@@ -0,0 +1,131 @@
+"""Shows how interfaces are stacked on each other (iptool tree): the ports of
+each bridge or bond, and the VLANs, macvlans, etc. on top of each interface.
+
+The children of every interface are indexed in one pass over the link dump,
+after which the tree under an interface is built by following the index, so
+it takes time in proportion to the size of the tree, and only the interfaces
+in it have their fields decoded.
+
+An interface can have two parents (e.g. a VLAN that is a port of a bridge),
+in which case it's shown under both.  Interfaces whose parent isn't in the
+dump (e.g. because it's in another network namespace) are shown at the top.
+"""
+
+import errno
+
+from . import netlink_error
+from . import iplist
+from . import render
+from .globals import params
+
+
+# How a child is related to its parent
+PORT = "port"       # The parent is the child's master, e.g. a bridge or bond
+UPPER = "upper"     # The child is on top of the parent (its parent_link)
+
+# How many trees to buffer before writing them out
+batch_size = 1024
+
+
+class Topology(object):
+    """Maps interface IDs to a list of (relation, ID) tuples for each of the
+    interface's children."""
+
+    def __init__(self, interfaces, options = None):
+        """@param interfaces  An associative array of Interface objects
+                              indexed by ID, from a full link dump
+        @param options        A globals.Options (for sorting), by default params
+        """
+        self.interfaces = interfaces
+        self.options = params if options is None else options
+        self.children = {}
+        self.has_parent = set()
+        for i in interfaces.values():
+            if i.master is not None and i.master in interfaces:
+                self.add(i.master, PORT, i.id)
+            lower = i.parent_link
+            # Leave out the peers of veths (etc.) in this namespace, which
+            # are each other's parent_link
+            if lower and lower != i.id and lower in interfaces and i.parent_is_local() \
+               and interfaces[lower].parent_link != i.id:
+                self.add(lower, UPPER, i.id)
+
+
+    def add(self, parent, relation, child):
+        self.children.setdefault(parent, []).append((relation, child))
+        self.has_parent.add(child)
+
+
+    def subtree(self, index, relation = None, ancestors = frozenset(), seen = None):
+        """Returns an associative array describing the interface with ID
+        index (see render.tree_record()), with those of its children in a
+        list under 'children'.  Children that are also ancestors are left
+        out, so a loop in the relations doesn't go on forever.
+        @param relation  How the interface is related to its parent
+        @param seen      A set to add the ID of every interface in the tree to
+        """
+        i = self.interfaces[index]
+        if seen is not None:
+            seen.add(index)
+        ancestors = ancestors | { index }
+        fields = self.options['sort']
+        grouping = not self.options['no-grouping']
+        children = sorted((pair for pair in self.children.get(index, ())
+                           if pair[1] not in ancestors),
+                          key=lambda pair: self.interfaces[pair[1]].sort_key(fields, grouping))
+
+        record = render.tree_record(i, relation)
+        record['children'] = [self.subtree(child, child_relation, ancestors, seen)
+                              for child_relation, child in children]
+        return record
+
+
+    def forest(self):
+        """Generates the tree under each interface that has no parent, in
+        sorted order, then under any interfaces that weren't reached (which
+        can only happen if the relations form a loop)."""
+        ordered = iplist.sort_links(self.interfaces, self.options)
+        seen = set()
+        for i in ordered:
+            if i.id not in self.has_parent:
+                yield self.subtree(i.id, seen=seen)
+        for i in ordered:
+            if i.id not in seen:
+                yield self.subtree(i.id, seen=seen)
+
+
+
+def get_topology(s, name = None, options = None):
+    """Dumps the interfaces and returns a Topology of them, along with the ID
+    of the interface called name (or None if name isn't given).  Raises
+    OSError if there's no such interface."""
+    # Children can be anywhere in the dump, so the whole dump is needed
+    interfaces = iplist.get_interfaces(s)
+    index = None
+    if name is not None:
+        for i in interfaces.values():
+            if i.name == name:
+                index = i.id
+                break
+        else:
+            raise netlink_error(errno.ENODEV)
+    return Topology(interfaces, options), index
+
+
+def show_tree(s, name = None):
+    """Shows the tree of interfaces under the one called name, or all of
+    them.  Raises OSError if there's no such interface."""
+    topology, index = get_topology(s, name)
+
+    r = render.make_renderer()
+    if index is not None:
+        r.tree(topology.subtree(index))
+    else:
+        count = 0
+        for record in topology.forest():
+            r.tree(record)
+            count += 1
+            if r.incremental and count % batch_size == 0:
+                r.flush()
+    r.flush()
+    return 0
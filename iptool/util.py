@@ -1,59 +1,93 @@
-import ctypes
-import binascii
+import types
 
-import cpylmnl.linux.rtnetlinkh as rtnl
-import cpylmnl.linux.ifh
-import cpylmnl.linux.if_linkh as if_link
-import cpylmnl.linux.if_addrh as if_addr
+from . import decode
+from . import constants
+from . import timing
 
 
 link_types = { 1: "Ethernet", 772: "loopback", 0xFFFE: "other" }
-addr_scopes = { rtnl.RT_SCOPE_UNIVERSE: "global",
-                rtnl.RT_SCOPE_SITE:     "site",
-                rtnl.RT_SCOPE_LINK:     "link",
-                rtnl.RT_SCOPE_HOST:     "host",
-                rtnl.RT_SCOPE_NOWHERE:  "nowhere" }
+addr_scopes = { constants.RT_SCOPE_UNIVERSE: "global",
+                constants.RT_SCOPE_SITE:     "site",
+                constants.RT_SCOPE_LINK:     "link",
+                constants.RT_SCOPE_HOST:     "host",
+                constants.RT_SCOPE_NOWHERE:  "nowhere" }
 
-operstates = { cpylmnl.linux.ifh.IF_OPER_UP: "up",
-               cpylmnl.linux.ifh.IF_OPER_NOTPRESENT: "not-present",
-               cpylmnl.linux.ifh.IF_OPER_DOWN: "down",
-               cpylmnl.linux.ifh.IF_OPER_LOWERLAYERDOWN: "waiting",
-               cpylmnl.linux.ifh.IF_OPER_TESTING: "testing",
-               cpylmnl.linux.ifh.IF_OPER_DORMANT: "dormant" }
+operstates = { constants.IF_OPER_UP: "up",
+               constants.IF_OPER_NOTPRESENT: "not-present",
+               constants.IF_OPER_DOWN: "down",
+               constants.IF_OPER_LOWERLAYERDOWN: "waiting",
+               constants.IF_OPER_TESTING: "testing",
+               constants.IF_OPER_DORMANT: "dormant" }
+
+# Sorting by state puts interfaces in reverse alphabetical order of Friendly
+# state, i.e. "up" first and "disabled" last
+state_ranks = { state: rank for rank, state in
+                enumerate(sorted(list(operstates.values()) + ["disabled"], reverse=True)) }
 
 
 
 def default_rtattr_handler(id, data, meta):
-    return "unknown", "unknown rtattr of type %d (len: %d)" % (id, ctypes.sizeof(data.contents))
+    if timing.stats is not None:
+        timing.stats.unknown_attr("link info", id)
+    return "unknown", "unknown rtattr of type %d (len: %d)" % (id, len(data))
 
-default_rtattr_map = { if_addr.IFA_UNSPEC: default_rtattr_handler }
+default_rtattr_map = { constants.IFA_UNSPEC: default_rtattr_handler }
 
 
 def vlan_rtattr_handler(id, data, meta):
-    ## print ctypes.sizeof(data.contents)
-    if id == if_link.IFLA_VLAN_ID:
-        return 'vlan_id', (ctypes.cast(data, ctypes.POINTER(ctypes.c_short))).contents.value
-    elif id == if_link.IFLA_VLAN_FLAGS:
-        vlan_flags = (ctypes.cast(data, ctypes.POINTER(if_link.IflaVlanFlags))).contents
-        return 'vlan_flags', vlan_flags.flags
+    ## print len(data)
+    if id == constants.IFLA_VLAN_ID:
+        return 'vlan_id', decode.u16.unpack_from(data)[0]
+    elif id == constants.IFLA_VLAN_FLAGS:
+        # struct ifla_vlan_flags starts with the flags, followed by the mask
+        return 'vlan_flags', decode.u32.unpack_from(data)[0]
 
-link_data_rtattr_map = { if_link.IFLA_VLAN_ID: vlan_rtattr_handler,
-                         if_link.IFLA_VLAN_FLAGS: vlan_rtattr_handler,
-                         if_addr.IFA_UNSPEC: default_rtattr_handler }
+link_data_rtattr_map = { constants.IFLA_VLAN_ID: vlan_rtattr_handler,
+                         constants.IFLA_VLAN_FLAGS: vlan_rtattr_handler,
+                         constants.IFA_UNSPEC: default_rtattr_handler }
 
 def link_kind_rtattr_handler(id, data, meta):
-    return 'kind', ctypes.cast(data, ctypes.c_char_p).value.decode('ascii')
+    return 'kind', decode.string(data)
+
+link_info_rtattr_map = { constants.IFLA_INFO_KIND: link_kind_rtattr_handler,
+                         constants.IFLA_INFO_DATA: ('data', link_data_rtattr_map),
+                         constants.IFA_UNSPEC: default_rtattr_handler }
+
+def process_rta_chain(data, table, meta = None):
+    """Deals with a sequence of rtattr structures.
+    @param data     A buffer (e.g. memoryview) containing the structures
+    @param table    An associative array mapping rta_type IDs to one of the following:
+                      - a function, i.e. fn(id, data, meta) that returns a tuple consisting of a property name and a value
+                      - OR a tuple consisting of a property name and a similar table showing how to process nesting rtattr structures
+    @param meta     Optional information passed down the call tree
+    @return         An associative array of property names mapping to info values
+    """
+
+    return_values = {}
+
+    for rta_type, attr_data in decode.attrs(data):
+        ## print(rta_type)
+        if rta_type in table:
+            if type(table[rta_type]) == types.FunctionType:
+                label, info = table[rta_type](rta_type, attr_data, meta)
+                return_values[label] = info
+            else:
+                label, subtable = table[rta_type]
+                return_values[label] = process_rta_chain(attr_data, subtable, meta)
+        else:
+            # use this tables's default handler function, if any
+            if constants.IFA_UNSPEC in table:
+                label, info = table[constants.IFA_UNSPEC](rta_type, attr_data, meta)
+                return_values[label] = info
 
-link_info_rtattr_map = { if_link.IFLA_INFO_KIND: link_kind_rtattr_handler,
-                         if_link.IFLA_INFO_DATA: ('data', link_data_rtattr_map),
-                         if_addr.IFA_UNSPEC: default_rtattr_handler }
+    return return_values
 
 def decode_link_type(type):
     return link_types.get(type, "unknown")
 
 
-def decode_mac_addr(arr):
-    return ':'.join(['%02x' % n for n in arr])
+def decode_mac_addr(data):
+    return bytes(data).hex(':')
 
 
 def decode_scope(scope):
@@ -64,15 +98,15 @@ def decode_link_state(operstate, flags):
     # Note that IF_OPER_LOWERLAYERDOWN and IFF_LOWER_UP cover different areas
     # See https://www.kernel.org/doc/Documentation/networking/operstates.txt
     ## return '%d [%04x]' % (operstate, flags)
-    if not flags & cpylmnl.linux.ifh.IFF_UP:
+    if not flags & constants.IFF_UP:
         return "disabled"
-    elif operstate != cpylmnl.linux.ifh.IF_OPER_UNKNOWN:
+    elif operstate != constants.IF_OPER_UNKNOWN:
         return operstates[operstate]
     else:
-        if flags & cpylmnl.linux.ifh.IFF_LOWER_UP:
-            return operstates[cpylmnl.linux.ifh.IF_OPER_UP]
+        if flags & constants.IFF_LOWER_UP:
+            return operstates[constants.IF_OPER_UP]
         else:
-            return operstates[cpylmnl.linux.ifh.IF_OPER_DOWN]
+            return operstates[constants.IF_OPER_DOWN]
 
 
 def add_extra(s, l):